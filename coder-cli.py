@@ -1,20 +1,64 @@
 import os
 import sys
+import csv
+import gzip
+import hashlib
 import json
+import math
+import random
+import re
+import time
+import atexit
+import argparse
+import threading
 # import lunar_interceptor
 import requests
 import pytz
-from datetime import datetime
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from urllib.parse import urlsplit
 from dateutil import parser
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 
 # Hardcoded Coder API route
 coder_api_route = "api/v2"
 coder_url = ""
 coder_session_token = ""
 coder_org_id = ""
+organization_cache = {}
 current_deployment = {}
 verbose = 0
 
+# Shared HTTP session so repeated and concurrent calls reuse pooled connections
+http_pool_size = 64
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=http_pool_size))
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=http_pool_size))
+
+# Workspace watch settings: above the stream limit the watch polls the list endpoint instead
+watch_stream_limit = 50
+watch_poll_interval = 2
+
+# Benchmark settings: give up on a phase after this many seconds
+benchmark_phase_timeout = 900
+
+# Most objects the session entity store keeps before evicting the least recently used
+entity_store_size = int(os.environ.get('CODER_CLI_CACHE_SIZE', 10000))
+# Seconds a cached list (e.g. all templates) is reused before it is fetched again
+entity_store_list_ttl = 60
+# Seconds a cached object that changes over time (e.g. a workspace) is reused before it is fetched again
+entity_store_object_ttl = 30
+
+# Local state (insights cache etc.) lives here, override with CODER_CLI_STATE_DIR
+state_dir = os.environ.get('CODER_CLI_STATE_DIR', os.path.join(os.path.expanduser("~"), ".coder-cli"))
+insights_windows = [7, 30, 90]
+# Insights are rolled up from agent stats with a delay, so a day is only cached once it ended this long ago
+insights_settle_time = timedelta(hours=1)
+
 # Initialize deployment variables
 deployment1 = {
     "coder_url": os.environ.get('CODER_URL_1','').rstrip('/'),
@@ -54,7 +98,7 @@ def check_api_connection():
 
   # get release
   api_url = f"{coder_url}/{coder_api_route}/buildinfo"
-  response = requests.get(api_url, headers=headers)
+  response = session.get(api_url, headers=headers)
   if response.status_code == 200:
     #print(response.text)
     process_response(response, "re")
@@ -69,25 +113,21 @@ def check_api_connection():
 
   # get user count
   api_url = f"{coder_url}/{coder_api_route}/users"
-  response = requests.get(api_url, headers=headers)
+  response = session.get(api_url, headers=headers)
   if response.status_code == 200:
     process_response(response, "uc")
   else:
     print("Error:", response.status_code)
     print("Error:", response.text)  
 
-  # get template count
-  api_url = f"{coder_url}/{coder_api_route}/organizations/{coder_org_id}/templates"
-  response = requests.get(api_url, headers=headers)
-  if response.status_code == 200:
-    process_response(response, "tc")
-  else:
-    print("Error:", response.status_code)
-    print("Error:", response.text)  
+  # get template count across all of the user's organizations
+  templates = get_templates()
+  if templates is not None:
+    print(f"# of templates: {len(templates)} (across {len(get_organizations())} organization(s))")
 
   # get running workspace count
   api_url = f"{coder_url}/{coder_api_route}/workspaces"
-  response = requests.get(api_url, headers=headers)
+  response = session.get(api_url, headers=headers)
   if response.status_code == 200:
     process_response(response, "wc")
   else:
@@ -96,7 +136,7 @@ def check_api_connection():
 
   # get running workspace count
   api_url = f"{coder_url}/{coder_api_route}/workspaces?q=status%3Arunning"
-  response = requests.get(api_url, headers=headers)
+  response = session.get(api_url, headers=headers)
   if response.status_code == 200:
     process_response(response, "rwc")
   else:
@@ -106,6 +146,7 @@ def check_api_connection():
 def set_current_deployment(chosen_deployment):
   global current_deployment, coder_url, coder_session_token, headers
   current_deployment = chosen_deployment
+  entity_store.clear()
   coder_url = current_deployment["coder_url"]
   coder_session_token = current_deployment["coder_session_token"]
   headers = {"Coder-Session-Token": current_deployment["coder_session_token"]}
@@ -220,6 +261,280 @@ def mask_token(token):
     return f"{token[:4]}{'*' * mask_length}{token[-4:]}"
 
 
+class EntityStore:
+    """Session-scoped identity map of API objects.
+
+    Objects are keyed by kind and id and versioned by updated_at, so an older copy never
+    replaces a newer one. Each object remembers when it was last stored so readers can
+    ask for one no older than max_age. The least recently used objects are evicted past
+    max_size.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.entities = OrderedDict()
+            self.lists = {}
+            self.hits = self.misses = self.stale = self.evictions = 0
+
+    @staticmethod
+    def newer(entity, current):
+        if not entity.get('updated_at') or not current.get('updated_at') or entity['updated_at'] == current['updated_at']:
+            return True
+        return parser.isoparse(entity['updated_at']) >= parser.isoparse(current['updated_at'])
+
+    def put(self, kind, entity):
+        """Stores an object unless a newer version is already held. Returns the stored copy."""
+        key = (kind, entity.get('id'))
+        with self.lock:
+            current = self.entities.get(key, (None, None))[1]
+            if current is None or self.newer(entity, current):
+                current = entity
+            # Storing either copy confirms the held one is current as of now
+            self.entities[key] = (time.monotonic(), current)
+            self.entities.move_to_end(key)
+            while len(self.entities) > self.max_size:
+                self.entities.popitem(last=False)
+                self.evictions += 1
+        return current
+
+    def put_workspace(self, workspace):
+        """Stores a workspace along with its latest build and that build's resources and agents."""
+        latest_build = workspace.get('latest_build') or {}
+        if latest_build.get('id'):
+            self.put("build", latest_build)
+        for resource in latest_build.get('resources') or []:
+            self.put("resource", resource)
+            for agent in resource.get('agents') or []:
+                self.put("agent", agent)
+        return self.put("workspace", workspace)
+
+    def get(self, kind, entity_id, max_age=None):
+        """Returns a cached object, or None if it is missing or was stored over max_age seconds ago."""
+        with self.lock:
+            stored_at, entity = self.entities.get((kind, entity_id), (None, None))
+            if entity is None:
+                self.misses += 1
+                return None
+            if max_age is not None and time.monotonic() - stored_at > max_age:
+                self.stale += 1
+                return None
+            self.entities.move_to_end((kind, entity_id))
+            self.hits += 1
+            return entity
+
+    def put_list(self, name, kind, entities):
+        """Stores the objects of a list query and remembers which ids it returned."""
+        ids = [self.put(kind, entity).get('id') for entity in entities]
+        with self.lock:
+            self.lists[name] = (time.monotonic(), kind, ids)
+
+    def get_list(self, name, max_age=entity_store_list_ttl):
+        """Returns the objects of a recent list query, or None if it must be fetched again."""
+        with self.lock:
+            fetched_at, kind, ids = self.lists.get(name, (0, None, []))
+        if time.monotonic() - fetched_at > max_age:
+            with self.lock:
+                self.misses += 1
+            return None
+        entities = [self.get(kind, entity_id) for entity_id in ids]
+        return None if None in entities else entities
+
+    def print_stats(self):
+        with self.lock:
+            kinds = {}
+            for kind, _ in self.entities:
+                kinds[kind] = kinds.get(kind, 0) + 1
+            lookups = self.hits + self.misses + self.stale
+            print(f"\nEntity cache: {len(self.entities)}/{self.max_size} objects")
+            for kind, count in sorted(kinds.items()):
+                print(f"  {kind}: {count}")
+            print(f"Hits: {self.hits}, misses: {self.misses}, stale: {self.stale}, evictions: {self.evictions}")
+            if lookups:
+                print(f"Hit rate: {100 * self.hits / lookups:.1f}%")
+
+
+entity_store = EntityStore(entity_store_size)
+
+
+class RecordedBody:
+    """Wraps a live response body and records each chunk with its offset from the request start."""
+
+    def __init__(self, raw, exchange, started, recorder):
+        self._raw = raw
+        self._exchange = exchange
+        self._started = started
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def _record(self, chunk):
+        if chunk:
+            self._exchange["chunks"].append([round(time.monotonic() - self._started, 4), self._recorder.redact(chunk).decode('latin-1')])
+        return chunk
+
+    def stream(self, amt=2**16, decode_content=None):
+        for chunk in self._raw.stream(amt, decode_content=True):
+            yield self._record(chunk)
+
+    def read(self, amt=None, decode_content=None, **kwargs):
+        return self._record(self._raw.read(amt, decode_content=True))
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Transport adapter that captures every API exchange, including event streams, into a cassette."""
+
+    def __init__(self, cassette_path, redact=False, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette_path = cassette_path
+        self.redact_token = redact
+        self.exchanges = []
+        self.lock = threading.Lock()
+
+    def redact(self, data):
+        if self.redact_token and coder_session_token:
+            return data.replace(coder_session_token.encode(), mask_token(coder_session_token).encode())
+        return data
+
+    def send(self, request, **kwargs):
+        started = time.monotonic()
+        response = super().send(request, **kwargs)
+        request_headers = dict(request.headers)
+        if self.redact_token and "Coder-Session-Token" in request_headers:
+            request_headers["Coder-Session-Token"] = mask_token(request_headers["Coder-Session-Token"])
+        exchange = {
+            "started": started,
+            "method": request.method,
+            "url": self.redact(request.url.encode()).decode(),
+            "request_headers": request_headers,
+            "request_body": self.redact(request.body.encode() if isinstance(request.body, str) else request.body or b"").decode('latin-1'),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": dict(response.headers),
+            "latency": round(time.monotonic() - started, 4),
+            "chunks": [],
+        }
+        with self.lock:
+            self.exchanges.append(exchange)
+        response.raw = RecordedBody(response.raw, exchange, started, self)
+        return response
+
+    def save(self):
+        """Writes all exchanges, in request order, as gzip-compressed JSON lines."""
+        with self.lock:
+            exchanges = sorted(self.exchanges, key=lambda exchange: exchange["started"])
+        origin = exchanges[0]["started"] if exchanges else 0
+        with gzip.open(self.cassette_path, 'wt', encoding='utf-8') as cassette:
+            cassette.write(json.dumps({"coder_url": coder_url, "recorded_at": datetime.now().isoformat(), "exchanges": len(exchanges)}) + "\n")
+            for exchange in exchanges:
+                exchange = dict(exchange, started=round(exchange["started"] - origin, 4))
+                cassette.write(json.dumps(exchange) + "\n")
+        print(f"\nRecorded {len(exchanges)} API exchange(s) to {self.cassette_path}")
+
+
+class ReplayBody:
+    """Serves recorded body chunks, sleeping so each arrives at its recorded (scaled) offset."""
+
+    def __init__(self, chunks, started, scale):
+        self._chunks = chunks
+        self._started = started
+        self._scale = scale
+
+    def stream(self, amt=None, decode_content=None):
+        for offset, data in self._chunks:
+            delay = self._started + offset * self._scale - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            yield data.encode('latin-1')
+
+    def read(self, amt=None, decode_content=None, **kwargs):
+        data = b"".join(self.stream())
+        self._chunks = []
+        return data
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class ReplayAdapter(BaseAdapter):
+    """Transport adapter that answers requests from a cassette instead of the network.
+
+    Requests are matched on method, path and query string, in recorded order; once a
+    request's recordings run out the last one is served again.
+    """
+
+    def __init__(self, cassette_path, scale=1.0):
+        super().__init__()
+        self.scale = scale
+        self.exchanges = defaultdict(deque)
+        with gzip.open(cassette_path, 'rt', encoding='utf-8') as cassette:
+            self.info = json.loads(cassette.readline())
+            for line in cassette:
+                exchange = json.loads(line)
+                self.exchanges[self.key(exchange["method"], exchange["url"])].append(exchange)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(method, url):
+        parts = urlsplit(url)
+        return (method, f"{parts.path}?{parts.query}")
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        started = time.monotonic()
+        with self.lock:
+            recorded = self.exchanges.get(self.key(request.method, request.url))
+            if recorded:
+                exchange = recorded.popleft() if len(recorded) > 1 else recorded[0]
+            else:
+                exchange = {"status": 404, "reason": "Not Found", "headers": {"Content-Type": "application/json"}, "latency": 0,
+                            "chunks": [[0, json.dumps({"message": f"{request.method} {request.url} is not in the cassette"})]]}
+        time.sleep(exchange["latency"] * self.scale)
+
+        response = requests.Response()
+        response.status_code = exchange["status"]
+        response.reason = exchange["reason"]
+        response.headers = CaseInsensitiveDict({name: value for name, value in exchange["headers"].items()
+                                                if name.lower() not in ("content-encoding", "transfer-encoding", "content-length")})
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = ReplayBody(exchange["chunks"], started, self.scale)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+def start_recording(cassette_path, redact=False):
+  """
+  This function routes all API calls through a recording transport and saves the cassette at exit.
+  """
+  recorder = RecordingAdapter(cassette_path, redact, pool_connections=4, pool_maxsize=http_pool_size)
+  session.mount("http://", recorder)
+  session.mount("https://", recorder)
+  atexit.register(recorder.save)
+  print(f"Recording API traffic to {cassette_path}{' (token redacted)' if redact else ''}")
+
+def start_replay(cassette_path, scale=1.0):
+  """
+  This function serves all API calls from a recorded cassette, with timings multiplied by scale.
+  Returns the deployment URL the cassette was recorded against.
+  """
+  replayer = ReplayAdapter(cassette_path, scale)
+  session.mount("http://", replayer)
+  session.mount("https://", replayer)
+  print(f"Replaying API traffic from {cassette_path} recorded {replayer.info.get('recorded_at')} (timing scale {scale})")
+  return replayer.info.get('coder_url')
+
+
 
 def format_roles(roles):
   """
@@ -253,7 +568,7 @@ def get_org_id():
   print(f"Headers: {headers}")
   """  
   
-  response = requests.get(api_url, headers=headers)
+  response = session.get(api_url, headers=headers)
   if response.status_code == 200:
     try:
       user = response.json()
@@ -270,6 +585,90 @@ def get_org_id():
     print("Error:", response.text)
     return None
 
+def get_organizations():
+  """
+  This function returns the organizations the authenticated user belongs to, keyed by id.
+  The result is cached per deployment, so it is fetched once per session.
+  """
+  if coder_url not in organization_cache:
+    api_url = f"{coder_url}/{coder_api_route}/users/me/organizations"
+    response = session.get(api_url, headers=headers)
+    if response.status_code != 200:
+      print("Error:", response.status_code)
+      print("Error:", response.text)
+      return {coder_org_id: {"id": coder_org_id}} if coder_org_id else {}
+    organization_cache[coder_url] = {org.get('id'): org for org in response.json()}
+  return organization_cache[coder_url]
+
+def get_templates():
+  """
+  This function lists templates from all of the user's organizations concurrently and
+  merges them, adding each template's organization name and display name. Returns None on error.
+  """
+  cached = entity_store.get_list("templates")
+  if cached is not None:
+    return cached
+
+  organizations = get_organizations()
+
+  def fetch(org_id):
+    api_url = f"{coder_url}/{coder_api_route}/organizations/{org_id}/templates"
+    response = session.get(api_url, headers=headers)
+    response.raise_for_status()
+    return org_id, response.json()
+
+  try:
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(organizations)))) as executor:
+      results = list(executor.map(fetch, organizations))
+  except requests.RequestException as e:
+    print(f"Error listing templates: {e}")
+    return None
+
+  templates = []
+  for org_id, org_templates in results:
+    org = organizations[org_id]
+    for template in org_templates:
+      # The name addresses the template in URLs, the display name is for people
+      template['organization_name'] = org.get('name') or template.get('organization_name') or org_id
+      template['organization_display_name'] = org.get('display_name') or template['organization_name']
+      templates.append(template)
+  entity_store.put_list("templates", "template", templates)
+  return templates
+
+def print_templates(templates):
+  """
+  This function prints template details, including the organization each belongs to.
+  """
+  print(f"\n# of templates: {len(templates)}\n")
+
+  for template in templates:
+    name = template.get('display_name') + " (" + template.get('name') + ")"
+    description = template.get('description')
+    created_at = template.get('created_at')
+    updated_at = template.get('updated_at')
+    active_users = template.get('active_user_count')
+    created_by = template.get('created_by_name')
+    deprecated = template.get('deprecated')
+    # Template names are only unique within an organization, so the URL names both
+    if template.get('organization_name'):
+      template_url = current_deployment['coder_url'] + "/templates/" + template.get('organization_name') + "/" + template.get('name')
+    else:
+      template_url = current_deployment['coder_url'] + "/templates/" + template.get('name')
+
+    # ... Extract other data points
+    print(f"\nDisplay(name): {name}")
+    if template.get('organization_display_name') or template.get('organization_name'):
+      print(f"  Organization: {template.get('organization_display_name') or template.get('organization_name')}")
+    if description:
+      print(f"  Description: {description}")
+    print(f"  URL: {template_url}")
+    print(f"  Created by: {created_by}")
+    print(f"  Created at: {format_timestamp_with_offset(created_at)}")
+    print(f"  Updated at: {format_timestamp_with_offset(updated_at)}")
+    if deprecated:
+      print(f"  **deprecated**")
+    print(f"  Active users: {active_users}")
+
 def format_user_info(user):
   """
   This function formats user information for printing, without date formatting.
@@ -284,6 +683,41 @@ def format_user_info(user):
   return f"Username: {username}\nEmail: {email}\nRoles: {roles_formatted}\nOrganization Id(s): {org_ids_formatted}\nLast Seen: {last_seen}\nCreated At: {created_at}"
 
 
+def user_workspace_report():
+  """
+  This function prints each user's workspace count, running count, last build time and
+  daily cost. Workspaces and users are each streamed once and joined on owner id, so the
+  number of API calls grows with pages, not users.
+  """
+  started = time.perf_counter()
+
+  # Hash index of per-owner workspace totals, built from one pass over all workspaces
+  owners = {}
+  for workspace in iter_workspaces():
+    entity_store.put_workspace(workspace)
+    latest_build = workspace.get('latest_build', {})
+    totals = owners.setdefault(workspace.get('owner_id'), {"workspaces": 0, "running": 0, "last_built": None, "daily_cost": 0})
+    totals["workspaces"] += 1
+    if latest_build.get('status') == 'running':
+      totals["running"] += 1
+    totals["daily_cost"] += latest_build.get('daily_cost') or 0
+    if latest_build.get('created_at'):
+      built = parser.isoparse(latest_build.get('created_at'))
+      if totals["last_built"] is None or built > totals["last_built"]:
+        totals["last_built"] = built
+
+  print(f"\n  {'Username':<24} {'Workspaces':>10} {'Running':>8} {'Daily cost':>10}  Last built")
+  user_count = 0
+  for user in iter_pages("users", "users"):
+    entity_store.put("user", user)
+    user_count += 1
+    totals = owners.get(user.get('id'), {"workspaces": 0, "running": 0, "last_built": None, "daily_cost": 0})
+    last_built = format_timestamp_with_offset(totals["last_built"].isoformat()) if totals["last_built"] else "Never"
+    print(f"  {user.get('username'):<24} {totals['workspaces']:>10} {totals['running']:>8} {totals['daily_cost']:>10}  {last_built}")
+
+  workspace_count = sum(totals["workspaces"] for totals in owners.values())
+  print(f"\nTotal users: {user_count}, workspaces: {workspace_count} ({time.perf_counter() - started:.2f}s)")
+
 def format_build_info(build):
   """
   This function formats build information for printing
@@ -309,7 +743,7 @@ def format_build_info(build):
 def check_update():
 
   api_url = f"{coder_url}/{coder_api_route}/updatecheck"
-  response = requests.get(api_url, headers=headers)
+  response = session.get(api_url, headers=headers)
   if response.status_code == 200:
     process_response(response, "up")
   else:
@@ -319,7 +753,7 @@ def check_update():
 def get_ports(ws_id):
 
   api_url = f"{coder_url}/{coder_api_route}/workspaces/{ws_id}/port-share"
-  response = requests.get(api_url, headers=headers)
+  response = session.get(api_url, headers=headers)
   if response.status_code == 200:
     
     shares = response.json()
@@ -340,7 +774,7 @@ def get_agent_metadata(agent_id):
     api_url = f"{coder_url}/{coder_api_route}/workspaceagents/{agent_id}/watch-metadata"
 
     try:
-        response = requests.get(api_url, headers=headers, stream=True)
+        response = session.get(api_url, headers=headers, stream=True)
         response.raise_for_status()  # Raise an exception for bad status codes
         
         for line in response.iter_lines():
@@ -380,23 +814,45 @@ def get_agents(workspace_id):
 
     # get the agent id
 
-    api_url = f"{coder_url}/{coder_api_route}/workspaces/{workspace_id}"
-    response = requests.get(api_url, headers=headers)
-    if response.status_code == 200:
-      workspace = response.json()
-      resources = workspace.get('latest_build').get('resources', [])
-      if resources:
-        for resource in resources:
-          agents = resource.get('agents', [])
-          for agent in agents:
-            agent_id = agent.get('id')
-            print(f"    Agent Id: {agent_id}")
-
-            # get the agent metadata
-            get_agent_metadata(agent_id)
-    else:
-      print("Error:", response.status_code)
-      print("Error:", response.text)
+    # the workspace list already carries the latest build, only fetch if it is not cached
+    workspace = entity_store.get("workspace", workspace_id, max_age=entity_store_object_ttl)
+    if workspace is None:
+      api_url = f"{coder_url}/{coder_api_route}/workspaces/{workspace_id}"
+      response = session.get(api_url, headers=headers)
+      if response.status_code != 200:
+        print("Error:", response.status_code)
+        print("Error:", response.text)
+        return
+      workspace = entity_store.put_workspace(response.json())
+
+    resources = workspace.get('latest_build').get('resources', [])
+    if resources:
+      for resource in resources:
+        agents = resource.get('agents', [])
+        for agent in agents:
+          agent_id = agent.get('id')
+          print(f"    Agent Id: {agent_id}")
+
+          # get the agent metadata
+          get_agent_metadata(agent_id)
+
+def get_template_version_resources(template_version_id):
+  """
+  This function returns the resources of a template version. Template versions do not
+  change, so each one is fetched once per session. Returns None on error.
+  """
+  cached = entity_store.get("template_version_resources", template_version_id)
+  if cached is not None:
+    return cached["resources"]
+
+  api_url = f"{coder_url}/{coder_api_route}/templateversions/{template_version_id}/resources"
+  response = session.get(api_url, headers=headers)
+  if response.status_code != 200:
+    print("Error:", response.status_code)
+    print("Error:", response.text)
+    return None
+  entity_store.put("template_version_resources", {"id": template_version_id, "resources": response.json()})
+  return response.json()
 
 def extract_ipv4(address_string):
   """
@@ -408,8 +864,6 @@ def extract_ipv4(address_string):
   ip_address = parts[0]
   return ip_address
 
-import re
-
 def extract_ipv6(address_string):
 
 
@@ -437,6 +891,152 @@ def count_provisioners(data):
   return total_provisioners
 
 
+def format_provisioner_tags(tags):
+  """
+  This function turns a provisioner tag map into a stable label like owner=,scope=organization.
+  """
+  if not tags:
+    return "untagged"
+  return ",".join(f"{key}={value}" for key, value in sorted(tags.items()))
+
+def fetch_provisioner_jobs(org_id, params, limit=100):
+  """
+  This function returns an organization's provisioner jobs matching params. The endpoint has
+  a limit but no offset, so a full result is fetched again with a larger limit until it
+  comes back short. Pass a limit above the number of ids when looking jobs up by id, so
+  one call always suffices.
+  """
+  api_url = f"{coder_url}/{coder_api_route}/organizations/{org_id}/provisionerjobs"
+  while True:
+    response = session.get(api_url, headers=headers, params={**params, "limit": limit})
+    response.raise_for_status()
+    jobs = response.json()
+    if len(jobs) < limit:
+      return jobs
+    limit *= 4
+
+def sample_provisioners(org_ids, include_daemons, previous=None):
+  """
+  This function takes one sample of pending and running provisioner jobs, and of provisioner
+  daemons when include_daemons is set. Only the active jobs are listed; jobs in previous
+  that are no longer active are fetched by id to get their start and completion times.
+  Returns per-tag daemon counts (or None), active jobs by id, finished jobs by id, and
+  the sample time.
+  """
+  daemons = {} if include_daemons else None
+  active = {}
+  finished = {}
+  for org_id in org_ids:
+    if include_daemons:
+      response = session.get(f"{coder_url}/{coder_api_route}/organizations/{org_id}/provisionerdaemons", headers=headers)
+      response.raise_for_status()
+      for daemon in response.json():
+        tag = format_provisioner_tags(daemon.get('tags'))
+        daemons[tag] = daemons.get(tag, 0) + 1
+    for job in fetch_provisioner_jobs(org_id, {"status": "pending,running"}):
+      active[job.get('id')] = job
+  now = datetime.now(timezone.utc)
+
+  gone = [job_id for job_id, job in (previous or {}).items() if job_id not in active]
+  for org_id in org_ids:
+    org_gone = [job_id for job_id in gone if previous[job_id].get('organization_id') in (None, org_id)]
+    for start in range(0, len(org_gone), 100):
+      chunk = org_gone[start:start + 100]
+      for job in fetch_provisioner_jobs(org_id, {"ids": ",".join(chunk)}, limit=len(chunk) + 1):
+        finished[job.get('id')] = job
+  return daemons, active, finished, now
+
+def monitor_provisioners():
+  """
+  This function samples provisioner daemons and the provisioner job queue on an interval and
+  keeps a rolling window of queue depth, job wait time and job run time per provisioner tag,
+  alerting when jobs wait in the queue longer than a threshold.
+  """
+  try:
+    interval = int(input("\nEnter sample interval in seconds (press Enter for 10): ") or 10)
+    window = int(input("Enter rolling window in minutes (press Enter for 15): ") or 15) * 60
+    threshold = int(input("Alert when queued jobs wait longer than this many seconds (press Enter for 60): ") or 60)
+  except ValueError:
+    print("Invalid input. Please enter a number. Returning to main menu.")
+    return
+
+  org_ids = list(get_organizations())
+  depths = deque()     # (sample time, tag, pending jobs)
+  waits = deque()      # (sample time, tag, seconds from queued to started)
+  runs = deque()       # (sample time, tag, seconds from started to finished)
+  jobs_seen = {}
+  daemons = {}
+  samples = 0
+
+  try:
+    while True:
+      try:
+        # Daemons change rarely, so they are refreshed every few samples only
+        sampled_daemons, active, finished, now = sample_provisioners(org_ids, samples % 6 == 0, jobs_seen)
+      except requests.RequestException as e:
+        # Skip this sample and keep the jobs seen so far, so a single failed call does not end the monitor
+        print(f"Error sampling provisioners: {e}")
+        time.sleep(interval)
+        continue
+      samples += 1
+      if sampled_daemons is not None:
+        daemons = sampled_daemons
+
+      pending = {}
+      oldest_pending = {}
+      for job_id, job in active.items():
+        tag = format_provisioner_tags(job.get('tags'))
+        if job.get('status') == 'pending':
+          pending[tag] = pending.get(tag, 0) + 1
+          age = (now - parser.isoparse(job.get('created_at'))).total_seconds()
+          oldest_pending[tag] = max(oldest_pending.get(tag, 0), age)
+        elif job_id not in jobs_seen or not jobs_seen[job_id].get('started_at'):
+          # First time this job is seen running, its queue wait is now known
+          if job.get('started_at'):
+            waits.append((now, tag, (parser.isoparse(job.get('started_at')) - parser.isoparse(job.get('created_at'))).total_seconds()))
+      for job_id, job in jobs_seen.items():
+        if job_id in active:
+          continue
+        # Jobs that finished since the last sample, possibly without ever being seen running
+        done = finished.get(job_id, job)
+        tag = format_provisioner_tags(job.get('tags'))
+        if done.get('started_at') and not job.get('started_at'):
+          waits.append((now, tag, (parser.isoparse(done.get('started_at')) - parser.isoparse(done.get('created_at'))).total_seconds()))
+        if done.get('started_at'):
+          completed_at = parser.isoparse(done.get('completed_at')) if done.get('completed_at') else now
+          runs.append((now, tag, (completed_at - parser.isoparse(done.get('started_at'))).total_seconds()))
+      jobs_seen = active
+
+      for tag in set(pending) | set(daemons) | {format_provisioner_tags(job.get('tags')) for job in active.values()}:
+        depths.append((now, tag, pending.get(tag, 0)))
+      for series in (depths, waits, runs):
+        while series and (now - series[0][0]).total_seconds() > window:
+          series.popleft()
+
+      print("\x1b[H\x1b[J", end='')
+      print(f"Provisioner queue on {coder_url} - {now.astimezone().strftime('%H:%M:%S')} - window {window // 60}m - Ctrl+C to stop\n")
+      print(f"  {'Tags':<36} {'Daemons':>7} {'Queued':>6} {'Avg q':>6} {'Max q':>6} {'Wait p50/p90 s':>15} {'Run p50/p90 s':>14}")
+      alerts = []
+      for tag in sorted({tag for _, tag, _ in depths} | set(daemons)):
+        tag_depths = [depth for _, depth_tag, depth in depths if depth_tag == tag]
+        tag_waits = [seconds for _, wait_tag, seconds in waits if wait_tag == tag]
+        tag_runs = [seconds for _, run_tag, seconds in runs if run_tag == tag]
+        wait_text = f"{percentile(tag_waits, 50):.0f}/{percentile(tag_waits, 90):.0f}" if tag_waits else "-"
+        run_text = f"{percentile(tag_runs, 50):.0f}/{percentile(tag_runs, 90):.0f}" if tag_runs else "-"
+        average_depth = sum(tag_depths) / len(tag_depths) if tag_depths else 0
+        print(f"  {tag:<36} {daemons.get(tag, 0):>7} {pending.get(tag, 0):>6} {average_depth:>6.1f} {max(tag_depths, default=0):>6} {wait_text:>15} {run_text:>14}")
+        if oldest_pending.get(tag, 0) > threshold:
+          alerts.append(f"ALERT: {tag} has a job queued for {oldest_pending[tag]:.0f}s")
+        elif tag_waits and percentile(tag_waits, 90) > threshold:
+          alerts.append(f"ALERT: {tag} p90 queue wait is {percentile(tag_waits, 90):.0f}s")
+      if alerts:
+        print("\n" + "\n".join(alerts) + "\a")
+
+      time.sleep(interval)
+  except KeyboardInterrupt:
+    print("\nStopped monitoring provisioners.")
+
+
 
 
 def get_health(verbose):
@@ -444,7 +1044,7 @@ def get_health(verbose):
   #print(f"verbose: {verbose}")
 
   api_url = f"{coder_url}/{coder_api_route}/debug/health"
-  response = requests.get(api_url, headers=headers)
+  response = session.get(api_url, headers=headers)
   if response.status_code == 200:
     
     health = response.json()
@@ -509,6 +1109,160 @@ def get_health(verbose):
     print("Error:", response.text)
 
 
+class RequestBudgetExceeded(Exception):
+    """Raised when a scrape would make more upstream calls than its budget allows."""
+
+
+def scrape_deployment(deployment, budget):
+  """
+  This function collects fleet and health metrics from one deployment, making at most
+  budget API calls. Workspace pages are fetched last, with whatever budget is left.
+  Returns a list of (metric name, labels, value) samples.
+  """
+  base_url = f"{deployment['coder_url']}/{coder_api_route}"
+  deployment_headers = {"Coder-Session-Token": deployment["coder_session_token"]}
+  calls = 0
+
+  def get(path, **params):
+    nonlocal calls
+    if calls >= budget:
+      raise RequestBudgetExceeded(path)
+    calls += 1
+    response = session.get(f"{base_url}/{path}", headers=deployment_headers, params=params, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+  labels = {"deployment": deployment["coder_url"]}
+  samples = []
+  started = time.monotonic()
+  partial = 0
+  workspace_counts = {}
+
+  try:
+    health = get("debug/health")
+    samples += [
+      ("coder_healthy", labels, int(bool(health.get('healthy')))),
+      ("coder_database_healthy", labels, int(bool(health.get('database', {}).get('healthy')))),
+      ("coder_database_latency_seconds", labels, (health.get('database', {}).get('latency_ms') or 0) / 1000),
+      ("coder_derp_healthy", labels, int(bool(health.get('derp', {}).get('healthy')))),
+      ("coder_derp_regions", labels, count_regions(health)),
+      ("coder_access_url_healthy", labels, int(bool(health.get('access_url', {}).get('healthy')))),
+      ("coder_websocket_healthy", labels, int(bool(health.get('websocket', {}).get('healthy')))),
+      ("coder_provisioners", labels, count_provisioners(health)),
+    ]
+
+    update = get("updatecheck")
+    samples.append(("coder_update_available", dict(labels, version=update.get('version') or ''), int(not update.get('current'))))
+
+    samples.append(("coder_users", labels, get("users", limit=1).get('count', 0)))
+
+    for org_id in get("users/me").get('organization_ids', []):
+      templates = get(f"organizations/{org_id}/templates")
+      samples.append(("coder_templates", dict(labels, organization_id=org_id), len(templates)))
+
+    offset = 0
+    while True:
+      page = get("workspaces", limit=100, offset=offset)
+      workspaces = page.get('workspaces') or []
+      for workspace in workspaces:
+        key = (workspace.get('latest_build', {}).get('status'), workspace.get('template_name'))
+        workspace_counts[key] = workspace_counts.get(key, 0) + 1
+      offset += len(workspaces)
+      if len(workspaces) < 100 or offset >= page.get('count', 0):
+        break
+  except RequestBudgetExceeded:
+    partial = 1
+
+  for (status, template), count in sorted(workspace_counts.items(), key=str):
+    samples.append(("coder_workspaces", dict(labels, status=status or '', template=template or ''), count))
+
+  samples += [
+    ("coder_up", labels, 1),
+    ("coder_scrape_partial", labels, partial),
+    ("coder_scrape_requests", labels, calls),
+    ("coder_scrape_duration_seconds", labels, round(time.monotonic() - started, 3)),
+    ("coder_last_scrape_timestamp_seconds", labels, int(time.time())),
+  ]
+  return samples
+
+def format_metrics(samples):
+  """
+  This function renders samples in the Prometheus text exposition format.
+  """
+  def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+  lines = []
+  seen = set()
+  for name, labels, value in sorted(samples, key=lambda sample: sample[0]):
+    if name not in seen:
+      seen.add(name)
+      lines.append(f"# TYPE {name} gauge")
+    label_text = ",".join(f'{key}="{escape(label)}"' for key, label in labels.items())
+    lines.append(f"{name}{{{label_text}}} {value}")
+  return ("\n".join(lines) + "\n").encode('utf-8')
+
+def create_exporter(host, port, interval, budget):
+  """
+  This function starts scraping every configured deployment on a schedule and returns an
+  HTTP server, not yet serving, that answers /metrics from the cached results. Requests
+  to /metrics never trigger upstream calls.
+  """
+  from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+  configured = [deployment for deployment in deployments if deployment["coder_url"] and deployment["coder_session_token"]]
+  scraped = {deployment["coder_url"]: [("coder_up", {"deployment": deployment["coder_url"]}, 0)] for deployment in configured}
+  metrics = {"body": format_metrics([sample for samples in scraped.values() for sample in samples])}
+
+  def scrape_loop():
+    while True:
+      started = time.monotonic()
+      for deployment in configured:
+        try:
+          scraped[deployment["coder_url"]] = scrape_deployment(deployment, budget)
+        except Exception as e:
+          # Any failure, including an unexpected response shape, marks only this deployment down
+          # and must not end the scrape thread while /metrics keeps serving the last body
+          print(f"Error scraping {deployment['coder_url']}: {e!r}")
+          scraped[deployment["coder_url"]] = [("coder_up", {"deployment": deployment["coder_url"]}, 0)]
+        metrics["body"] = format_metrics([sample for samples in scraped.values() for sample in samples])
+      time.sleep(max(0, interval - (time.monotonic() - started)))
+
+  class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+      if self.path.split('?')[0] != "/metrics":
+        self.send_error(404)
+        return
+      body = metrics["body"]
+      self.send_response(200)
+      self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def log_message(self, format, *args):
+      pass
+
+  server = ThreadingHTTPServer((host, port), MetricsHandler)
+  server.deployment_count = len(configured)
+  threading.Thread(target=scrape_loop, daemon=True).start()
+  return server
+
+def run_exporter(host, port, interval, budget):
+  """
+  This function serves the metrics exporter until interrupted. It listens on host, which
+  is the loopback interface unless --exporter-host allows remote scrapers.
+  """
+  server = create_exporter(host, port, interval, budget)
+  print(f"Serving metrics for {server.deployment_count} deployment(s) on http://{host or '0.0.0.0'}:{server.server_address[1]}/metrics "
+        f"(scrape every {interval}s, at most {budget} API calls per deployment per scrape)")
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    print("\n\nExiting...\n\n")
+  finally:
+    server.server_close()
+
 
 def update_workspace_state(transition, chosen_workspace):
   """
@@ -518,7 +1272,7 @@ def update_workspace_state(transition, chosen_workspace):
       transition (str): The desired transition state ("start" or "stop").
 
   Returns:
-      bool: True if the API call was successful, False otherwise.
+      dict: The queued workspace build if the API call was successful, False otherwise.
   """  
 
   api_url = f"{coder_url}/{coder_api_route}/workspaces/{chosen_workspace['id']}/builds"
@@ -530,13 +1284,722 @@ def update_workspace_state(transition, chosen_workspace):
   data = json.dumps({'transition': transition})
 
   try:
-      response = requests.post(api_url, headers=headers, data=data)
+      response = session.post(api_url, headers=headers, data=data)
       response.raise_for_status()  # Raise an exception for non-200 status codes
-      return True
+      return response.json()
   except requests.exceptions.RequestException as e:
       print(f"Error updating workspace state: {e}")
       return False
 
+def fetch_new_audit_logs(cursor, page_size=25):
+  """
+  This function returns audit log entries newer than the cursor, oldest first. Pages are
+  fetched newest first until one reaches the cursor. Without a cursor only the most
+  recent page is fetched. Returns None if any page fails, so the cursor is not moved
+  past entries that were never seen.
+  """
+  api_url = f"{coder_url}/{coder_api_route}/audit"
+  cursor_time = parser.isoparse(cursor["time"]) if cursor else None
+  params = {"limit": page_size, "offset": 0}
+  if cursor_time:
+    params["q"] = f"date_from:{cursor_time.strftime('%Y-%m-%d')}"
+
+  new_logs = []
+  seen_ids = set()
+  while True:
+    try:
+      response = session.get(api_url, headers=headers, params=params)
+    except requests.RequestException as e:
+      print("Request error:", e)
+      return None
+    if response.status_code != 200:
+      print("Error:", response.status_code)
+      print("Error:", response.text)
+      return None
+    logs = response.json().get('audit_logs') or []
+    reached_cursor = False
+    for log in logs:
+      log_time = parser.isoparse(log.get('time'))
+      if cursor_time and (log_time < cursor_time or (log_time == cursor_time and log.get('id') in cursor["ids"])):
+        reached_cursor = True
+        break
+      # Entries added while paging shift later pages down, so the same entry can come back
+      if log.get('id') in seen_ids:
+        continue
+      seen_ids.add(log.get('id'))
+      new_logs.append(log)
+    if reached_cursor or not cursor_time or len(logs) < page_size:
+      break
+    params["offset"] += len(logs)
+
+  return list(reversed(new_logs))
+
+def advance_audit_cursor(cursor, logs):
+  """
+  This function moves the cursor to the newest of logs, remembering every id at that
+  timestamp so entries sharing it are not shown twice.
+  """
+  if not logs:
+    return cursor
+  newest = logs[-1].get('time')
+  ids = [log.get('id') for log in logs if log.get('time') == newest]
+  if cursor and cursor["time"] == newest:
+    ids += cursor["ids"]
+  return {"time": newest, "ids": ids}
+
+def tail_audit_log():
+  """
+  This function shows audit log entries added since the last time it ran on this deployment,
+  optionally filtered locally by action, resource type or user, and can keep following.
+  The newest entry seen is remembered on disk as the cursor.
+  """
+  action_filter = input("\nFilter by action e.g., start, stop, create (press Enter for all): ").strip().lower()
+  resource_filter = input("Filter by resource type e.g., workspace_build, template (press Enter for all): ").strip().lower()
+  user_filter = input("Filter by username (press Enter for all): ").strip().lower()
+  follow = input("Keep following new entries? (y/n) ").lower() == 'y'
+
+  def matches(log):
+    return ((not action_filter or log.get('action', '').lower() == action_filter)
+            and (not resource_filter or log.get('resource_type', '').lower() == resource_filter)
+            and (not user_filter or (log.get('user') or {}).get('username', '').lower() == user_filter))
+
+  cursor = load_state("audit-cursor", {}).get("cursor")
+  print(f"\nAudit log entries since {format_timestamp_with_offset(cursor['time']) if cursor else 'the most recent page'}:\n")
+
+  try:
+    while True:
+      logs = fetch_new_audit_logs(cursor)
+      if logs is None:
+        # Keep the cursor where it was so the missed entries are fetched on the next try
+        if not follow:
+          break
+        time.sleep(watch_poll_interval * 2)
+        continue
+      for log in logs:
+        if matches(log):
+          username = (log.get('user') or {}).get('username', 'system')
+          print(f"  {format_timestamp_with_offset(log.get('time'))}  {username:<16} {log.get('action'):<8} "
+                f"{log.get('resource_type')}/{log.get('resource_target')} ({log.get('status_code')})")
+      cursor = advance_audit_cursor(cursor, logs)
+      save_state("audit-cursor", {"cursor": cursor})
+      if not follow:
+        break
+      time.sleep(watch_poll_interval * 2)
+  except KeyboardInterrupt:
+    print("\nStopped following the audit log.")
+
+def iter_pages(api_path, key, query=None, page_size=100, workers=1):
+  """
+  This function pages through a Coder list endpoint with limit/offset and yields
+  one item at a time, so large result sets are never held in memory at once.
+  With workers above 1, pages after the first are fetched that many at a time.
+  """
+  api_url = f"{coder_url}/{coder_api_route}/{api_path}"
+
+  def fetch_page(offset):
+    params = {"limit": page_size, "offset": offset}
+    if query:
+      params["q"] = query
+    response = session.get(api_url, headers=headers, params=params)
+    if response.status_code != 200:
+      print("Error:", response.status_code)
+      print("Error:", response.text)
+      return None
+    return response.json()
+
+  offset = 0
+  while True:
+    page = fetch_page(offset)
+    if page is None:
+      return
+    items = page.get(key) or []
+    yield from items
+    offset += len(items)
+    if len(items) < page_size or offset >= page.get('count', 0):
+      return
+    if workers > 1:
+      break
+
+  # The first page gave the total, so the remaining pages can be fetched side by side
+  offsets = list(range(offset, page.get('count', 0), page_size))
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    for batch in range(0, len(offsets), workers):
+      for page in executor.map(fetch_page, offsets[batch:batch + workers]):
+        if page is None:
+          return
+        yield from page.get(key) or []
+
+def iter_workspaces(query=None, workers=1):
+  """
+  This function streams workspaces matching an optional search query.
+  """
+  return iter_pages("workspaces", "workspaces", query, workers=workers)
+
+def iter_sse_data(response):
+  """
+  This function yields the decoded JSON payload of each "data:" line of a
+  server-sent events response.
+  """
+  for line in response.iter_lines():
+    if line:
+      line = line.decode('utf-8')
+      if line.startswith("data:"):
+        try:
+          yield json.loads(line[5:])
+        except json.JSONDecodeError:
+          continue
+
+def format_watch_row(workspace):
+  """
+  This function flattens a workspace into the columns shown by the watch table.
+  """
+  latest_build = workspace.get('latest_build', {})
+  return {
+    "name": workspace.get('name'),
+    "owner": workspace.get('owner_name') or latest_build.get('workspace_owner_name'),
+    "template": workspace.get('template_name'),
+    "status": latest_build.get('status'),
+    "healthy": workspace.get('health', {}).get('healthy'),
+    "build": f"{latest_build.get('transition')}/{latest_build.get('job', {}).get('status')}",
+    "updated_at": workspace.get('updated_at') or latest_build.get('updated_at'),
+  }
+
+def render_watch_table(rows, mode):
+  """
+  This function redraws the watch table in place.
+  """
+  print("\x1b[H\x1b[J", end='')
+  print(f"Watching {len(rows)} workspace(s) on {coder_url} ({mode}) - {datetime.now().strftime('%H:%M:%S')} - Ctrl+C to stop\n")
+  print(f"  {'Owner/Name':<40} {'Template':<20} {'Status':<12} {'Healthy':<8} Latest build")
+  for ws_id in sorted(rows, key=lambda i: (rows[i]['owner'] or '', rows[i]['name'] or '')):
+    row = rows[ws_id]
+    print(f"  {str(row['owner']) + '/' + str(row['name']):<40} {str(row['template']):<20} {str(row['status']):<12} {str(row['healthy']):<8} {row['build']}")
+
+def watch_workspace_stream(ws_id, rows, lock, changed, stop, failed):
+  """
+  This function follows a workspace's watch stream and updates its row on every event.
+  Sets failed if the deployment does not offer the stream so the watch can fall back to polling.
+  """
+  api_url = f"{coder_url}/{coder_api_route}/workspaces/{ws_id}/watch"
+  while not stop.is_set():
+    try:
+      with session.get(api_url, headers=headers, stream=True, timeout=(10, 60)) as response:
+        if response.status_code in (404, 405):
+          # Stream not supported by this deployment
+          failed.set()
+          return
+        if response.status_code != 200:
+          # Transient errors e.g., 5xx or 429 from opening many streams, retry after a pause
+          stop.wait(watch_poll_interval)
+          continue
+        for workspace in iter_sse_data(response):
+          if stop.is_set():
+            return
+          if isinstance(workspace, dict) and workspace.get('id') == ws_id:
+            row = format_watch_row(workspace)
+            with lock:
+              if rows.get(ws_id) != row:
+                rows[ws_id] = row
+                changed.set()
+    except requests.RequestException:
+      stop.wait(watch_poll_interval)
+
+def poll_workspaces(query, rows, lock, changed):
+  """
+  This function re-lists the watched workspaces page by page and only touches rows that changed.
+  """
+  for workspace in iter_workspaces(query):
+    ws_id = workspace.get('id')
+    if ws_id not in rows:
+      continue
+    entity_store.put_workspace(workspace)
+    row = format_watch_row(workspace)
+    with lock:
+      if rows[ws_id] != row:
+        rows[ws_id] = row
+        changed.set()
+
+def watch_workspaces():
+  """
+  This function shows a live table of workspace status, health and latest build state.
+  Small selections follow one watch stream per workspace; large ones poll the list endpoint.
+  """
+  query = input("\nEnter search query to watch (press Enter for all workspaces): ")
+  names = input("Limit to workspace names, comma-separated (press Enter for all matches): ")
+  selected = {name.strip() for name in names.split(',') if name.strip()}
+
+  rows = {}
+  for workspace in iter_workspaces(query):
+    if selected and workspace.get('name') not in selected:
+      continue
+    rows[workspace.get('id')] = format_watch_row(workspace)
+
+  if not rows:
+    print("\nNo workspaces found.")
+    return
+
+  lock = threading.Lock()
+  changed = threading.Event()
+  stop = threading.Event()
+  failed = threading.Event()
+  streaming = len(rows) <= watch_stream_limit
+
+  if streaming:
+    for ws_id in list(rows):
+      threading.Thread(target=watch_workspace_stream, args=(ws_id, rows, lock, changed, stop, failed), daemon=True).start()
+
+  try:
+    render_watch_table(rows, "streaming" if streaming else "polling")
+    while True:
+      if streaming and failed.is_set():
+        # Deployment has no watch endpoint, drop the streams and poll instead
+        stop.set()
+        streaming = False
+      if not streaming:
+        poll_workspaces(query, rows, lock, changed)
+      changed.wait(watch_poll_interval)
+      if changed.is_set():
+        changed.clear()
+        with lock:
+          render_watch_table(rows, "streaming" if streaming else "polling")
+  except KeyboardInterrupt:
+    print("\nStopped watching.")
+  finally:
+    stop.set()
+
+def percentile(values, pct):
+  """
+  This function returns the nearest-rank percentile of a list of numbers.
+  """
+  if not values:
+    return None
+  ordered = sorted(values)
+  rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+  return ordered[rank]
+
+def wait_for_workspace(ws_id, is_done, timeout=benchmark_phase_timeout):
+  """
+  This function follows a workspace's watch stream, calling is_done with each update
+  until it returns True. Falls back to polling the workspace if there is no stream.
+  Returns the last workspace seen, or None on timeout.
+  """
+  deadline = time.monotonic() + timeout
+  api_url = f"{coder_url}/{coder_api_route}/workspaces/{ws_id}"
+  try:
+    with session.get(f"{api_url}/watch", headers=headers, stream=True, timeout=(10, 60)) as response:
+      if response.status_code == 200:
+        for workspace in iter_sse_data(response):
+          if isinstance(workspace, dict) and workspace.get('id') == ws_id and is_done(workspace):
+            return workspace
+          if time.monotonic() > deadline:
+            return None
+  except requests.RequestException:
+    pass
+
+  while time.monotonic() < deadline:
+    response = session.get(api_url, headers=headers)
+    if response.status_code == 200 and is_done(response.json()):
+      return response.json()
+    time.sleep(1)
+  return None
+
+def get_connected_agent_id(workspace):
+  """
+  This function returns the id of the first connected agent of a workspace build, if any.
+  """
+  for resource in workspace.get('latest_build', {}).get('resources') or []:
+    for agent in resource.get('agents') or []:
+      if agent.get('status') == 'connected':
+        return agent.get('id')
+  return None
+
+def wait_for_agent_metadata(agent_id, timeout=60):
+  """
+  This function blocks until the first event arrives on an agent's metadata stream.
+  Returns True if an event arrived.
+  """
+  api_url = f"{coder_url}/{coder_api_route}/workspaceagents/{agent_id}/watch-metadata"
+  try:
+    with session.get(api_url, headers=headers, stream=True, timeout=(10, timeout)) as response:
+      if response.status_code == 200:
+        for _ in iter_sse_data(response):
+          return True
+  except requests.RequestException:
+    pass
+  return False
+
+def benchmark_workspace(workspace, cycles):
+  """
+  This function runs start/stop cycles on one workspace and timestamps each phase
+  of the start, in seconds since the start build was requested.
+  """
+  ws_id = workspace['id']
+  results = []
+
+  def build_status(ws):
+    return ws.get('latest_build', {}).get('status') if ws else None
+
+  def new_result(cycle):
+    result = {"template": workspace.get('template_name'), "workspace": workspace.get('name'), "cycle": cycle,
+              "queued": None, "running": None, "agent_connected": None, "first_metadata": None, "stopped": None, "error": ""}
+    results.append(result)
+    return result
+
+  # Cycles must start from a stopped workspace: let a start in progress finish, then stop it
+  status = build_status(workspace)
+  if status in ('pending', 'starting'):
+    status = build_status(wait_for_workspace(ws_id, lambda ws: build_status(ws) not in ('pending', 'starting')))
+  if status == 'running':
+    status = 'stopping' if update_workspace_state('stop', workspace) else status
+  if status in ('stopping', 'canceling'):
+    status = build_status(wait_for_workspace(ws_id, lambda ws: build_status(ws) in ('stopped', 'failed', 'canceled')))
+  if status != 'stopped':
+    new_result(0)["error"] = f"could not stop workspace before benchmarking (status {status or 'timed out'})"
+    return results
+
+  for cycle in range(cycles):
+    result = new_result(cycle + 1)
+
+    started = time.monotonic()
+    if not update_workspace_state('start', workspace):
+      result["error"] = "start failed"
+      break
+    result["queued"] = round(time.monotonic() - started, 3)
+
+    def start_done(ws):
+      job_status = ws.get('latest_build', {}).get('job', {}).get('status')
+      if result["running"] is None and job_status in ('running', 'succeeded'):
+        result["running"] = round(time.monotonic() - started, 3)
+      if job_status in ('failed', 'canceled'):
+        result["error"] = f"build {job_status}"
+        return True
+      return get_connected_agent_id(ws) is not None
+
+    ws = wait_for_workspace(ws_id, start_done)
+    if ws is None:
+      result["error"] = "timed out waiting for agent"
+      break
+    if result["error"]:
+      break
+    result["agent_connected"] = round(time.monotonic() - started, 3)
+
+    if wait_for_agent_metadata(get_connected_agent_id(ws)):
+      result["first_metadata"] = round(time.monotonic() - started, 3)
+
+    stopping = time.monotonic()
+    if not update_workspace_state('stop', workspace):
+      result["error"] = "stop failed"
+      break
+    status = build_status(wait_for_workspace(ws_id, lambda ws: build_status(ws) in ('stopped', 'failed', 'canceled')))
+    if status != 'stopped':
+      result["error"] = f"stop {status}" if status else "timed out waiting for stop"
+      break
+    result["stopped"] = round(time.monotonic() - stopping, 3)
+
+  return results
+
+def benchmark_workspaces():
+  """
+  This function benchmarks time-to-ready of the workspaces matching a search query and
+  prints per-template latency percentiles, then writes the raw timings to a CSV file.
+  """
+  query = input("\nEnter search query for workspaces to benchmark e.g., owner:me name:bench: ")
+  workspaces = list(iter_workspaces(query))
+  if not workspaces:
+    print("\nNo workspaces found.")
+    return
+
+  try:
+    cycles = int(input("Enter number of start/stop cycles per workspace: "))
+    concurrency = int(input(f"Enter number of workspaces to cycle at once (1-{len(workspaces)}): "))
+  except ValueError:
+    print("Invalid input. Please enter a number. Returning to main menu.")
+    return
+
+  print(f"\nThis will start and stop {len(workspaces)} workspace(s) {cycles} time(s) each:")
+  for workspace in workspaces:
+    print(f"  {workspace.get('owner_name')}/{workspace.get('name')} ({workspace.get('template_name')})")
+  if input("Continue? (y/n) ").lower() != 'y':
+    return
+
+  results = []
+  with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(workspaces)))) as executor:
+    for workspace_results in executor.map(lambda ws: benchmark_workspace(ws, cycles), workspaces):
+      results.extend(workspace_results)
+
+  phases = ["queued", "running", "agent_connected", "first_metadata", "stopped"]
+  templates = sorted({result["template"] for result in results})
+  for template in templates:
+    template_results = [result for result in results if result["template"] == template]
+    errors = sum(1 for result in template_results if result["error"])
+    print(f"\nTemplate: {template} ({len(template_results)} cycle(s), {errors} error(s))")
+    print(f"  {'Phase (seconds)':<18} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for phase in phases:
+      values = [result[phase] for result in template_results if result[phase] is not None]
+      if values:
+        print(f"  {phase:<18} {percentile(values, 50):>8.2f} {percentile(values, 90):>8.2f} {percentile(values, 99):>8.2f} {max(values):>8.2f}")
+
+  csv_path = f"coder-bm-{datetime.now().strftime('%Y%m%d-%H%M%S')}.csv"
+  with open(csv_path, 'w', newline='') as csv_file:
+    writer = csv.DictWriter(csv_file, fieldnames=["template", "workspace", "cycle"] + phases + ["error"])
+    writer.writeheader()
+    writer.writerows(results)
+  print(f"\nRaw timings written to {csv_path}")
+
+# Calls the load mode can replay, and the default mix of them by weight
+load_endpoints = ["workspaces", "users", "resources", "ports", "metadata", "health"]
+default_load_mix = "workspaces=4,users=2,resources=2,ports=1,metadata=1,health=1"
+
+def load_request(endpoint, targets):
+  """
+  This function makes one load-test call. Streams count as answered at their first event.
+  Returns True if the call succeeded.
+  """
+  base_url = f"{coder_url}/{coder_api_route}"
+  if endpoint == "workspaces":
+    response = session.get(f"{base_url}/workspaces", headers=headers, params={"limit": 25}, timeout=30)
+  elif endpoint == "users":
+    response = session.get(f"{base_url}/users", headers=headers, params={"limit": 25}, timeout=30)
+  elif endpoint == "resources":
+    response = session.get(f"{base_url}/templateversions/{random.choice(targets['resources'])}/resources", headers=headers, timeout=30)
+  elif endpoint == "ports":
+    response = session.get(f"{base_url}/workspaces/{random.choice(targets['ports'])}/port-share", headers=headers, timeout=30)
+  elif endpoint == "health":
+    response = session.get(f"{base_url}/debug/health", headers=headers, timeout=30)
+  else:
+    api_url = f"{base_url}/workspaceagents/{random.choice(targets['metadata'])}/watch-metadata"
+    with session.get(api_url, headers=headers, stream=True, timeout=30) as response:
+      return response.status_code == 200 and next(iter_sse_data(response), None) is not None
+  return response.status_code == 200
+
+def run_load_test(mix, rate, concurrency, duration):
+  """
+  This function replays a weighted mix of this tool's API calls for duration seconds, either
+  at a fixed request rate or, without a rate, as fast as concurrency workers allow, and
+  reports throughput, error rate and latency percentiles per endpoint.
+  Returns the per-endpoint latencies, errors and dropped calls, or None if nothing ran.
+  """
+  weights = {}
+  for part in mix.split(','):
+    endpoint, _, weight = part.partition('=')
+    if endpoint.strip() not in load_endpoints:
+      print(f"Unknown endpoint '{endpoint.strip()}' in mix. Choose from: {', '.join(load_endpoints)}")
+      return
+    try:
+      weights[endpoint.strip()] = float(weight or 1)
+    except ValueError:
+      weights[endpoint.strip()] = -1
+    if not 0 <= weights[endpoint.strip()] < math.inf:
+      print(f"Invalid weight '{weight}' for '{endpoint.strip()}' in mix. Weights must be numbers of 0 or more")
+      return
+
+  # Pick real ids to aim the per-object calls at from one page of workspaces
+  workspaces = list(islice(iter_workspaces(), 100))
+  targets = {
+    "resources": sorted({ws.get('latest_build', {}).get('template_version_id') for ws in workspaces} - {None}),
+    "ports": [ws.get('id') for ws in workspaces],
+    "metadata": [agent.get('id') for ws in workspaces for resource in ws.get('latest_build', {}).get('resources') or []
+                 for agent in resource.get('agents') or [] if agent.get('status') == 'connected'],
+  }
+  for endpoint in list(weights):
+    if endpoint in targets and not targets[endpoint]:
+      print(f"Skipping '{endpoint}': no {'connected agents' if endpoint == 'metadata' else 'workspaces'} to call it on")
+      del weights[endpoint]
+  if not weights:
+    return
+  if not sum(weights.values()):
+    print("Every endpoint in the mix has weight 0, nothing to call")
+    return
+
+  results = {endpoint: {"latencies": [], "errors": 0, "dropped": 0} for endpoint in weights}
+  submitted = 0
+  lock = threading.Lock()
+  endpoints, endpoint_weights = list(weights), list(weights.values())
+
+  def call(endpoint, scheduled, in_flight=None):
+    # Latency counts from when the call was due, calls finishing after the deadline are not counted
+    try:
+      ok = load_request(endpoint, targets)
+    except requests.RequestException:
+      ok = False
+    finally:
+      if in_flight:
+        in_flight.release()
+    finished = time.perf_counter()
+    with lock:
+      if finished > deadline:
+        return
+      results[endpoint]["latencies"].append(finished - scheduled)
+      if not ok:
+        results[endpoint]["errors"] += 1
+
+  print(f"\nGenerating load on {coder_url} for {duration}s: "
+        f"{f'{rate} requests/s' if rate else f'{concurrency} concurrent workers'}, mix {mix}")
+  started = time.perf_counter()
+  deadline = started + duration
+
+  if rate:
+    # Open loop: calls are due on a fixed schedule whether or not earlier ones have returned.
+    # Once concurrency calls are in flight, further calls are dropped and counted as errors
+    # rather than queued in the client.
+    in_flight = threading.BoundedSemaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    sent = 0
+    while True:
+      scheduled = started + sent / rate
+      if scheduled >= deadline:
+        break
+      time.sleep(max(0, scheduled - time.perf_counter()))
+      sent += 1
+      endpoint = random.choices(endpoints, endpoint_weights)[0]
+      if not in_flight.acquire(blocking=False):
+        with lock:
+          results[endpoint]["dropped"] += 1
+        continue
+      submitted += 1
+      executor.submit(call, endpoint, scheduled, in_flight)
+    time.sleep(max(0, deadline - time.perf_counter()))
+    executor.shutdown(wait=False)
+  else:
+    def worker():
+      while time.perf_counter() < deadline:
+        call(random.choices(endpoints, endpoint_weights)[0], time.perf_counter())
+    workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in workers:
+      thread.start()
+    for thread in workers:
+      thread.join()
+
+  with lock:
+    print(f"\n  {'Endpoint':<12} {'Requests':>9} {'Req/s':>8} {'Errors':>7} {'Dropped':>8} {'Error %':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for endpoint, result in results.items():
+      latencies = [latency * 1000 for latency in result["latencies"]]
+      attempted = len(latencies) + result["dropped"]
+      if not attempted:
+        continue
+      errors = result["errors"] + result["dropped"]
+      latency_text = (f"{percentile(latencies, 50):>8.1f} {percentile(latencies, 90):>8.1f} {percentile(latencies, 99):>8.1f} {max(latencies):>8.1f}"
+                      if latencies else f"{'-':>8} {'-':>8} {'-':>8} {'-':>8}")
+      print(f"  {endpoint:<12} {attempted:>9} {len(latencies) / duration:>8.1f} {errors:>7} {result['dropped']:>8} {100 * errors / attempted:>7.1f}% {latency_text}")
+    total = sum(len(result["latencies"]) for result in results.values())
+    errors = sum(result["errors"] + result["dropped"] for result in results.values())
+    print(f"\nTotal: {total} completed requests in {duration}s ({total / duration:.1f} req/s), {errors} error(s)")
+    if submitted > total:
+      print(f"{submitted - total} request(s) still in flight at the deadline were not counted")
+    return results
+
+def get_state_path(name):
+  """
+  This function returns the path of a local state file for the current deployment.
+  """
+  os.makedirs(state_dir, exist_ok=True)
+  deployment_key = hashlib.sha1(coder_url.encode()).hexdigest()[:12]
+  return os.path.join(state_dir, f"{name}-{deployment_key}.json")
+
+def load_state(name, default):
+  """
+  This function reads a local state file for the current deployment.
+  """
+  try:
+    with open(get_state_path(name)) as state_file:
+      return json.load(state_file)
+  except (OSError, json.JSONDecodeError):
+    return default
+
+def save_state(name, state):
+  """
+  This function atomically writes a local state file for the current deployment.
+  """
+  path = get_state_path(name)
+  with open(path + ".tmp", 'w') as state_file:
+    json.dump(state, state_file)
+  os.replace(path + ".tmp", path)
+
+def fetch_insights_day(day, day_end):
+  """
+  This function fetches template and user activity insights for one day.
+  """
+  params = {"start_time": day.strftime('%Y-%m-%dT%H:%M:%SZ'), "end_time": day_end.strftime('%Y-%m-%dT%H:%M:%SZ')}
+  templates = session.get(f"{coder_url}/{coder_api_route}/insights/templates", headers=headers, params=params)
+  users = session.get(f"{coder_url}/{coder_api_route}/insights/user-activity", headers=headers, params=params)
+  templates.raise_for_status()
+  users.raise_for_status()
+  report = templates.json().get('report', {})
+  return {
+    "active_users": report.get('active_users', 0),
+    "apps": {app.get('display_name') or app.get('slug'): app.get('seconds', 0) for app in report.get('apps_usage') or []},
+    "templates": {template_id: sum(app.get('seconds', 0) for app in report.get('apps_usage') or [] if template_id in (app.get('template_ids') or []))
+                  for template_id in report.get('template_ids') or []},
+    "users": {user.get('username'): user.get('seconds', 0) for user in users.json().get('report', {}).get('users') or []},
+  }
+
+def show_insights():
+  """
+  This function prints rolling 7/30/90-day usage aggregates. Insights are fetched in daily
+  buckets; days that ended more than insights_settle_time ago are cached on disk and never
+  fetched again, so after the first run only today, and just after midnight UTC also
+  yesterday, is requested.
+  """
+  started = time.perf_counter()
+  cache = load_state("insights", {"days": {}, "template_names": {}})
+  now = datetime.now(timezone.utc)
+  today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+  days = [today - timedelta(days=offset) for offset in range(max(insights_windows))]
+
+  # The open bucket ends at the next full hour, the API does not accept times further out
+  open_end = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+  open_days = {day for day in days if day + timedelta(days=1) + insights_settle_time >= now}
+  missing = [day for day in days if day in open_days or day.strftime('%Y-%m-%d') not in cache["days"]]
+  if len(missing) > 1:
+    print(f"\nFetching {len(missing)} day(s) of insights...")
+  try:
+    with ThreadPoolExecutor(max_workers=8) as executor:
+      buckets = list(executor.map(lambda day: fetch_insights_day(day, open_end if day == today else day + timedelta(days=1)), missing))
+  except requests.RequestException as e:
+    print(f"Error fetching insights: {e}")
+    return
+
+  current = {}
+  for day, bucket in zip(missing, buckets):
+    if day in open_days:
+      current[day] = bucket
+    else:
+      cache["days"][day.strftime('%Y-%m-%d')] = bucket
+
+  # Name any templates not seen before, then drop days that fell out of the longest window
+  template_ids = {template_id for bucket in list(cache["days"].values()) + list(current.values()) for template_id in bucket.get("templates", {})}
+  if template_ids - set(cache["template_names"]):
+    cache["template_names"].update({template.get('id'): template.get('name') for template in get_templates() or []})
+  oldest = days[-1].strftime('%Y-%m-%d')
+  cache["days"] = {day: bucket for day, bucket in cache["days"].items() if day >= oldest}
+  save_state("insights", cache)
+
+  for window in insights_windows:
+    window_buckets = [current[day] if day in current else cache["days"].get(day.strftime('%Y-%m-%d'), {}) for day in days[:window]]
+    daily_active = [bucket.get("active_users", 0) for bucket in window_buckets]
+    apps, templates, users = {}, {}, {}
+    for bucket in window_buckets:
+      for totals, key in ((apps, "apps"), (templates, "templates"), (users, "users")):
+        for name, seconds in bucket.get(key, {}).items():
+          totals[name] = totals.get(name, 0) + seconds
+
+    print(f"\nLast {window} days:")
+    print(f"  Daily active users: avg {sum(daily_active) / window:.1f}, peak {max(daily_active)}, today {daily_active[0]}")
+    if templates:
+      print("  Template usage (hours):")
+      for template_id, seconds in sorted(templates.items(), key=lambda item: -item[1])[:5]:
+        print(f"    - {cache['template_names'].get(template_id, template_id)}: {seconds / 3600:.1f}")
+    if apps:
+      print("  App usage (hours):")
+      for app, seconds in sorted(apps.items(), key=lambda item: -item[1])[:5]:
+        print(f"    - {app}: {seconds / 3600:.1f}")
+    if users:
+      print(f"  Most active users (hours, {len(users)} active):")
+      for username, seconds in sorted(users.items(), key=lambda item: -item[1])[:5]:
+        print(f"    - {username}: {seconds / 3600:.1f}")
+
+  print(f"\nInsights ready in {time.perf_counter() - started:.2f}s")
+
 def format_timestamp_with_offset(timestamp_str):
     # Parse the timestamp with the offset
     timestamp = parser.isoparse(timestamp_str)
@@ -569,6 +2032,150 @@ def format_timestamp_with_offset(timestamp_str):
 
     return formatted_datetime
 
+def parse_timestamps(timestamps):
+  """
+  This function parses many API timestamps at once. Each distinct value is parsed once,
+  with the standard library instead of dateutil; fractional seconds beyond microseconds
+  are dropped. Returns a dict of timestamp string to aware datetime.
+  """
+  fraction = re.compile(r"(\.\d{1,6})\d*")
+  parsed = {}
+  for timestamp in set(timestamps) - {None, ''}:
+    parsed[timestamp] = datetime.fromisoformat(fraction.sub(r"\1", timestamp).replace('Z', '+00:00'))
+  return parsed
+
+def scan_idle_workspaces():
+  """
+  This function finds running workspaces nobody is using and ranks them by daily cost.
+  Workspaces are idle when their agents are connected but unused for a while, and stale
+  when no agent is connected or they are unused and were last built long ago. Workspaces
+  in use are never listed however old their build, only running workspaces are
+  considered, and each distinct template version's resources are looked up once.
+  """
+  try:
+    idle_hours = float(input("\nIdle after how many hours without use? (press Enter for 24): ") or 24)
+    stale_days = float(input("Stale after how many days since the last build? (press Enter for 14): ") or 14)
+  except ValueError:
+    print("Invalid input. Please enter a number. Returning to main menu.")
+    return
+
+  started = time.perf_counter()
+  workspaces = list(iter_workspaces("status:running", workers=8))
+  timestamps = parse_timestamps([ws.get('last_used_at') for ws in workspaces] +
+                                [ws.get('latest_build', {}).get('created_at') for ws in workspaces])
+
+  version_ids = {ws.get('latest_build', {}).get('template_version_id') for ws in workspaces} - {None}
+  with ThreadPoolExecutor(max_workers=8) as executor:
+    version_costs = dict(zip(version_ids, executor.map(
+      lambda version_id: sum(resource.get('daily_cost') or 0 for resource in get_template_version_resources(version_id) or []
+                             if resource.get('workspace_transition') == 'start'), version_ids)))
+
+  now = datetime.now(timezone.utc)
+  candidates = []
+  for ws in workspaces:
+    latest_build = ws.get('latest_build', {})
+    agents = [agent for resource in latest_build.get('resources') or [] for agent in resource.get('agents') or []]
+    connected = any(agent.get('status') == 'connected' for agent in agents)
+    last_used = timestamps.get(ws.get('last_used_at'))
+    last_built = timestamps.get(latest_build.get('created_at'))
+    unused_hours = (now - last_used).total_seconds() / 3600 if last_used else None
+    built_days = (now - last_built).total_seconds() / 86400 if last_built else None
+
+    unused = f"unused {unused_hours:.0f}h" if unused_hours is not None else "never used"
+
+    if not connected:
+      reason = "stale: no agent connected"
+    elif unused_hours is not None and unused_hours <= idle_hours:
+      continue
+    elif built_days is not None and built_days > stale_days:
+      reason = f"stale: built {built_days:.0f}d ago, {unused}"
+    else:
+      reason = f"idle: {unused}"
+    candidates.append((version_costs.get(latest_build.get('template_version_id'), 0), unused_hours or 0, ws, reason))
+
+  candidates.sort(key=lambda candidate: (-candidate[0], -candidate[1]))
+  print(f"\n  {'Daily cost':>10}  {'Owner/Name':<40} {'Template':<20} Reason")
+  for cost, _, ws, reason in candidates[:50]:
+    print(f"  {cost:>10}  {ws.get('owner_name') + '/' + ws.get('name'):<40} {str(ws.get('template_name')):<20} {reason}")
+  if len(candidates) > 50:
+    print(f"  ... and {len(candidates) - 50} more")
+
+  print(f"\n{len(candidates)} of {len(workspaces)} running workspace(s) are idle or stale, "
+        f"daily cost {sum(candidate[0] for candidate in candidates)} ({time.perf_counter() - started:.2f}s)")
+
+def resolve_template_versions(template_id, active_version_id=None):
+  """
+  This function returns a template and its versions, newest first, from the entity store
+  when possible. The cached template is refetched when its active version differs from
+  active_version_id, as last reported by the template's workspaces, and the cached version
+  list only once the template's active version is missing from it.
+  """
+  template = entity_store.get("template", template_id)
+  if template is None or (active_version_id and template.get('active_version_id') != active_version_id):
+    response = session.get(f"{coder_url}/{coder_api_route}/templates/{template_id}", headers=headers)
+    response.raise_for_status()
+    template = entity_store.put("template", response.json())
+
+  cached = entity_store.get("template_versions", template_id)
+  if cached is None or template.get('active_version_id') not in {version.get('id') for version in cached["versions"]}:
+    response = session.get(f"{coder_url}/{coder_api_route}/templates/{template_id}/versions", headers=headers,
+                           params={"include_archived": "true"})
+    response.raise_for_status()
+    versions = sorted(response.json(), key=lambda version: version.get('created_at') or '', reverse=True)
+    cached = entity_store.put("template_versions", {"id": template_id, "versions": versions})
+  return template, cached["versions"]
+
+def template_drift_report():
+  """
+  This function shows, per template, how many workspaces run each template version and how
+  far behind the active version each one is. Workspaces are streamed once and grouped by
+  version; each distinct template is then resolved once, so the number of API calls depends
+  on the number of templates and versions, not workspaces.
+  """
+  started = time.perf_counter()
+  in_use = {}
+  active_versions = {}
+  for ws in iter_workspaces(workers=8):
+    latest_build = ws.get('latest_build', {})
+    # Each workspace also carries its template's active version, which shows if a cached template is stale
+    if ws.get('template_active_version_id'):
+      active_versions[ws.get('template_id')] = ws.get('template_active_version_id')
+    versions = in_use.setdefault(ws.get('template_id'), {})
+    version_id = latest_build.get('template_version_id')
+    versions[version_id] = versions.get(version_id, 0) + 1
+
+  try:
+    with ThreadPoolExecutor(max_workers=8) as executor:
+      resolved = dict(zip(in_use, executor.map(resolve_template_versions, in_use, [active_versions.get(template_id) for template_id in in_use])))
+  except requests.RequestException as e:
+    print(f"Error resolving template versions: {e}")
+    return
+
+  for template_id, counts in sorted(in_use.items(), key=lambda item: -sum(item[1].values())):
+    template, versions = resolved[template_id]
+    positions = {version.get('id'): index for index, version in enumerate(versions)}
+    names = {version.get('id'): version.get('name') for version in versions}
+    active_position = positions.get(template.get('active_version_id'), 0)
+    current = counts.get(template.get('active_version_id'), 0)
+    total = sum(counts.values())
+
+    print(f"\nTemplate: {template.get('display_name') or template.get('name')} ({template.get('name')}) - "
+          f"{current} of {total} workspace(s) on the active version {names.get(template.get('active_version_id'))}")
+    widest = max(counts.values())
+    for version_id, count in sorted(counts.items(), key=lambda item: positions.get(item[0], len(versions))):
+      if version_id == template.get('active_version_id'):
+        drift = "active"
+      elif version_id in positions:
+        behind = positions[version_id] - active_position
+        drift = f"{behind} behind" if behind > 0 else f"{-behind} ahead"
+      else:
+        drift = "unknown"
+      bar = '#' * max(1, round(40 * count / widest))
+      print(f"  {str(names.get(version_id, version_id)):<24} {drift:>10} {count:>6}  {bar}")
+
+  print(f"\n{sum(len(counts) for counts in in_use.values())} version(s) in use across {len(in_use)} template(s) "
+        f"({time.perf_counter() - started:.2f}s)")
+
 def process_response(response, action):
   """
   This function handles successful responses by parsing JSON and printing data,
@@ -607,11 +2214,6 @@ def process_response(response, action):
           upgrade_message = build.get('upgrade_message')
           print(f"Coder release: {release}")
 
-      elif action.lower() == 'tc':
-          template_data = response.json()
-          template_count = len(template_data)
-          print(f"# of templates: {template_count}")
-
       elif action.lower() == 'wc':
           workspace_data = response.json()
           workspace_count = workspace_data.get('count')
@@ -632,12 +2234,13 @@ def process_response(response, action):
           formatted_build_info = format_build_info(build_data)
           print(formatted_build_info)
           check_update()
+          show_insights()
 
 
       elif action.lower() == 'lu':
         user_data = response.json()
         user_count = user_data.get('count')
-        users = user_data.get('users', [])
+        users = [entity_store.put("user", user) for user in user_data.get('users', [])]
         formatted_users = [format_user_info(user) for user in users]
         print(f"Total Users: {user_count}\n")
         for user_info in formatted_users:
@@ -645,38 +2248,12 @@ def process_response(response, action):
           print("\n")
           
       elif action.lower() == 'lt':
-        # Iterate through templates and extract desired data
-        template_data = response.json()
-        template_count = len(template_data)
-
-        print(f"\n# of templates: {template_count}\n")
-
-        for template in data:
-          name = template.get('display_name') + " (" + template.get('name') + ")"
-          description = template.get('description')
-          created_at = template.get('created_at')
-          updated_at = template.get('updated_at')
-          active_users = template.get('active_user_count')
-          created_by = template.get('created_by_name')
-          deprecated = template.get('deprecated')
-          template_url = current_deployment['coder_url'] + "/templates/" + template.get('name')
-
-          # ... Extract other data points
-          print(f"\nDisplay(name): {name}")
-          if description:
-            print(f"  Description: {description}")
-          print(f"  URL: {template_url}")
-          print(f"  Created by: {created_by}")
-          print(f"  Created at: {format_timestamp_with_offset(created_at)}")
-          print(f"  Updated at: {format_timestamp_with_offset(updated_at)}")
-          if deprecated:
-            print(f"  **deprecated**")
-          print(f"  Active users: {active_users}")
+        print_templates(data)
 
       elif action.lower() == 'lw':
         workspace_data = response.json()
         workspace_count = workspace_data.get('count')
-        workspaces = workspace_data.get('workspaces', [])
+        workspaces = [entity_store.put_workspace(workspace) for workspace in workspace_data.get('workspaces', [])]
         print(f"Total workspaces: {workspace_count}\n")
         for i, workspace in enumerate(response.json()['workspaces']):
           name = workspace.get('name')
@@ -708,16 +2285,11 @@ def process_response(response, action):
               print(f"  Deprecated")  # Print 'deprecated' only if 'outdated' is True
 
 
-          # Construct the API endpoint URL to get resources since the API does not always 
+          # Get resources from the template version since the API does not always 
           # return resources in the workspace response i.e., when workspace is stopped
-          api_url = f"{coder_url}/{coder_api_route}/templateversions/{template_version_id}/resources"
-
-          # Send the GET request
-          response = requests.get(api_url, headers=headers)
+          resources = get_template_version_resources(template_version_id)
 
-          # Process the response
-          if response.status_code == 200:
-            resources = response.json()
+          if resources is not None:
             
             if resources:  
 
@@ -756,10 +2328,6 @@ def process_response(response, action):
 
             print()  # Add a new line after each workspace information
 
-          else:
-              print("Error:", response.status_code)
-              print("Error:", response.text)
-
 
 
         #print("\n\nSelect a workspace by number (or 'q' to quit):")
@@ -824,10 +2392,51 @@ def process_response(response, action):
 
 def main():
 
+    arg_parser = argparse.ArgumentParser(description="A simple CLI to interact with a Coder CDE deployment")
+    arg_parser.add_argument("--record", metavar="CASSETTE", help="capture every API exchange into a compressed cassette file")
+    arg_parser.add_argument("--redact", action="store_true", help="mask the session token in the recorded cassette")
+    arg_parser.add_argument("--replay", metavar="CASSETTE", help="serve API calls from a cassette instead of the deployment")
+    arg_parser.add_argument("--replay-scale", type=float, default=1.0, metavar="FACTOR",
+                            help="multiply recorded timings, e.g. 0 to replay as fast as possible (default 1)")
+    arg_parser.add_argument("--exporter", action="store_true", help="run as a metrics exporter daemon instead of the interactive menu")
+    arg_parser.add_argument("--exporter-host", default="127.0.0.1", metavar="HOST",
+                            help="address to serve /metrics on, e.g. 0.0.0.0 for remote scrapers (default 127.0.0.1)")
+    arg_parser.add_argument("--exporter-port", type=int, default=9191, metavar="PORT", help="port to serve /metrics on (default 9191)")
+    arg_parser.add_argument("--scrape-interval", type=int, default=60, metavar="SECONDS", help="seconds between scrapes (default 60)")
+    arg_parser.add_argument("--request-budget", type=int, default=50, metavar="CALLS",
+                            help="most API calls per deployment per scrape (default 50)")
+    arg_parser.add_argument("--load", action="store_true", help="generate API load against the current deployment and exit")
+    arg_parser.add_argument("--load-mix", default=default_load_mix, metavar="MIX",
+                            help=f"weighted calls to replay, from {', '.join(load_endpoints)} (default {default_load_mix})")
+    arg_parser.add_argument("--load-rate", type=float, default=0, metavar="RPS", help="target requests per second (default: as fast as workers allow)")
+    arg_parser.add_argument("--load-concurrency", type=int, default=8, metavar="N", help="concurrent workers, or most requests in flight with --load-rate (default 8)")
+    arg_parser.add_argument("--load-duration", type=int, default=30, metavar="SECONDS", help="how long to generate load (default 30)")
+    args = arg_parser.parse_args()
+
+    if args.exporter:
+        run_exporter(args.exporter_host, args.exporter_port, args.scrape_interval, args.request_budget)
+        return
+
+    # Time each action when recording or replaying so runs can be compared on identical traffic
+    time_actions = bool(args.record or args.replay)
+
+    deployment = current_deployment
+    if args.record:
+        start_recording(args.record, args.redact)
+    elif args.replay:
+        replay_url = start_replay(args.replay, args.replay_scale)
+        # Replays work offline, so fall back to the recorded deployment when none is configured
+        deployment = current_deployment or {"coder_url": replay_url, "coder_session_token": "replay-session-token"}
+
     # Set the current deployment
-    set_current_deployment(current_deployment)
+    set_current_deployment(deployment)
 
-    check_environment_variables()
+    if not args.replay:
+        check_environment_variables()
+
+    if args.load:
+        run_load_test(args.load_mix, args.load_rate, args.load_concurrency, args.load_duration)
+        return
 
     while True:
         try:
@@ -842,16 +2451,26 @@ def main():
             'lt' to list templates
             'lw' to list, start, stop workspaces
             'sw' to search workspaces
+            'ww' to watch live workspace status
+            'iw' to find idle or stale running workspaces
+            'dr' to report template version drift
+            'al' to show new audit log entries
+            'bm' to benchmark workspace time-to-ready
             'lu' to list users
+            'ur' to report workspaces per user
             'ui' to list authenticated user info
             'sd' to switch to another Coder deployment
             'ev' to list or inline change environment variables
+            'cs' to show entity cache statistics
             'hc' to do a health check and show details
+            'pm' to monitor the provisioner job queue
             'st' to list deployment stats & release
             'q' to exit:
             
             """)
 
+            action_started = time.perf_counter()
+
             if action.lower() == 'q':
                 print("\n\nExiting...\n\n")
                 break
@@ -859,10 +2478,12 @@ def main():
                 switch_deployment()
             elif action.lower() == 'hc':
                 get_health(1)
+            elif action.lower() == 'pm':
+                monitor_provisioners()
             elif action.lower() == 'sw':
                 query = input("\nEnter search query: ")
                 api_url = f"{coder_url}/{coder_api_route}/workspaces?q={query}"
-                response = requests.get(api_url, headers=headers)
+                response = session.get(api_url, headers=headers)
                 if response.status_code == 200:
                     print(f"\nWorkspaces matching '{query}':\n")
                     process_response(response, 'lw')  # Reuse the existing 'lw' action for processing the response
@@ -870,16 +2491,37 @@ def main():
                     print("Error:", response.status_code)
                     print("Error:", response.text)
 
+            elif action.lower() == 'ww':
+                watch_workspaces()
+
+            elif action.lower() == 'dr':
+                template_drift_report()
+
+            elif action.lower() == 'iw':
+                scan_idle_workspaces()
+
+            elif action.lower() == 'al':
+                tail_audit_log()
+
+            elif action.lower() == 'bm':
+                benchmark_workspaces()
+
+            elif action.lower() == 'cs':
+                entity_store.print_stats()
+
             elif action.lower() == 'ev':
                 print_environment_variables()
 
+            elif action.lower() == 'ur':
+                user_workspace_report()
+
             elif action.lower() == 'ui':
 
                 # Construct the API endpoint URL
                 api_url = f"{coder_url}/{coder_api_route}/users/me"
 
                 # Send the GET request
-                response = requests.get(api_url, headers=headers)
+                response = session.get(api_url, headers=headers)
 
                 # Process the response
                 if response.status_code == 200:
@@ -895,7 +2537,7 @@ def main():
                 api_url = f"{coder_url}/{coder_api_route}/users"
 
                 # Send the GET request
-                response = requests.get(api_url, headers=headers)
+                response = session.get(api_url, headers=headers)
 
                 # Process the response
                 if response.status_code == 200:
@@ -911,7 +2553,7 @@ def main():
                 api_url = f"{coder_url}/{coder_api_route}/workspaces"
 
                 # Send the GET request
-                response = requests.get(api_url, headers=headers)
+                response = session.get(api_url, headers=headers)
 
                 # Process the response
                 if response.status_code == 200:
@@ -923,26 +2565,18 @@ def main():
 
             elif action.lower() == 'lt':
 
-                # Construct the API endpoint URL
-                api_url = f"{coder_url}/{coder_api_route}/organizations/{coder_org_id}/templates"
-
-                # Send the GET request
-                response = requests.get(api_url, headers=headers)
-
-                # Process the response
-                if response.status_code == 200:
+                # List templates from every organization the user belongs to
+                templates = get_templates()
+                if templates is not None:
                     print(f"\nTemplates:")
-                    process_response(response, action)
-                else:
-                    print("Error:", response.status_code)
-                    print("Error:", response.text)
+                    print_templates(templates)
             elif action.lower() == 'st':
 
                 # Construct the API endpoint URL
                 api_url = f"{coder_url}/{coder_api_route}/buildinfo"
 
                 # Send the GET request
-                response = requests.get(api_url, headers=headers)
+                response = session.get(api_url, headers=headers)
 
                 # Process the response
                 if response.status_code == 200:
@@ -953,6 +2587,9 @@ def main():
                     print("Error:", response.text)
             else:
                 print("Invalid action. Please choose a valid option.")
+
+            if time_actions:
+                print(f"\nAction '{action}' took {time.perf_counter() - action_started:.3f}s")
             
 
         except KeyboardInterrupt:
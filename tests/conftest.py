@@ -0,0 +1,28 @@
+import importlib.util
+import os
+
+import pytest
+
+from mock_coder import MockCoder
+
+# coder-cli.py is a script rather than a package, so load it by path
+spec = importlib.util.spec_from_file_location(
+    "coder_cli", os.path.join(os.path.dirname(__file__), "..", "coder-cli.py"))
+coder_cli = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(coder_cli)
+
+
+@pytest.fixture
+def cli():
+    return coder_cli
+
+
+@pytest.fixture
+def mock_coder(cli, monkeypatch):
+    mock = MockCoder().start()
+    monkeypatch.setattr(cli, "coder_url", mock.url)
+    monkeypatch.setattr(cli, "coder_session_token", "test-token")
+    monkeypatch.setattr(cli, "headers", {"Coder-Session-Token": "test-token"}, raising=False)
+    cli.entity_store.clear()
+    yield mock
+    mock.stop()
@@ -0,0 +1,228 @@
+"""
+A small stand-in for the Coder API, serving just the endpoints the tests call. Builds
+move through pending, starting/stopping and running/stopped on timers so the watch
+streams see the same transitions a real deployment would send.
+"""
+import copy
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockCoder:
+    def __init__(self, latency=0.0, build_step=0.1):
+        # Seconds every plain GET takes, and seconds between build status changes
+        self.latency = latency
+        self.build_step = build_step
+        self.lock = threading.Lock()
+        self.workspaces = {}
+        self.builds = []
+        self.calls = []
+        # Query parameters of each GET, alongside calls
+        self.queries = []
+        self.users = [{"id": f"u{i}", "username": f"user{i}"} for i in range(5)]
+        self.audit_logs = []
+        self.provisioner_jobs = {}
+        self.organizations = [{"id": "org1", "name": "default", "display_name": "Default"}]
+        self.org_templates = {}
+        self.templates = {"t1": {"id": "t1", "name": "docker", "active_version_id": "v1"}}
+        self.template_versions = [{"id": "v1", "name": "v1", "template_id": "t1", "created_at": "2024-05-01T10:00:00Z"}]
+        # Optional callable(path, query) returning an HTTP status to fail a GET with
+        self.fail = None
+        # Optional callable run after each audit page is served, e.g. to add new entries
+        self.after_audit_page = None
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_workspace(self, ws_id, status="stopped", transition=None):
+        transition = transition or ("start" if status in ("running", "starting", "pending") else "stop")
+        workspace = {
+            "id": ws_id, "name": f"ws-{ws_id}", "owner_name": "user0", "template_id": "t1",
+            "latest_build": {"id": f"{ws_id}-b0", "status": status, "transition": transition,
+                             "template_version_id": "v1", "job": {"status": "succeeded"},
+                             "resources": self.agents(ws_id, "connected") if status == "running" else []},
+        }
+        with self.lock:
+            self.workspaces[ws_id] = workspace
+        return workspace
+
+    def add_audit_log(self, log_id, logged_at):
+        with self.lock:
+            self.audit_logs.append({"id": log_id, "time": logged_at, "action": "start",
+                                    "resource_type": "workspace_build", "user": {"username": "user0"}})
+
+    def add_provisioner_job(self, job_id, status="pending", **fields):
+        job = {"id": job_id, "organization_id": "org1", "status": status, "tags": {"scope": "organization"},
+               "created_at": "2024-05-01T10:00:00Z", "started_at": None, "completed_at": None, **fields}
+        with self.lock:
+            self.provisioner_jobs[job_id] = job
+        return job
+
+    def agents(self, ws_id, status):
+        return [{"name": "main", "agents": [{"id": f"{ws_id}-agent", "status": status}]}]
+
+    def set_build(self, ws_id, **fields):
+        with self.lock:
+            self.workspaces[ws_id]["latest_build"].update(fields)
+
+    def run_build(self, ws_id, steps):
+        # Apply each (status, job status, resources) step after build_step seconds
+        for status, job_status, resources in steps:
+            time.sleep(self.build_step)
+            self.set_build(ws_id, status=status, job={"status": job_status}, resources=resources)
+
+    def create_build(self, ws_id, transition):
+        self.builds.append((ws_id, transition))
+        with self.lock:
+            build = self.workspaces[ws_id]["latest_build"]
+            build.update({"id": f"{ws_id}-b{len(self.builds)}", "status": "pending",
+                          "transition": transition, "job": {"status": "pending"}, "resources": []})
+            created = copy.deepcopy(build)
+        if transition == "start":
+            steps = [("starting", "running", []), ("running", "succeeded", self.agents(ws_id, "connecting")),
+                     ("running", "succeeded", self.agents(ws_id, "connected"))]
+        else:
+            steps = [("stopping", "running", []), ("stopped", "succeeded", [])]
+        threading.Thread(target=self.run_build, args=(ws_id, steps), daemon=True).start()
+        return created
+
+    def snapshot(self, ws_id):
+        with self.lock:
+            return copy.deepcopy(self.workspaces[ws_id])
+
+    def handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, body, code=200):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def send_events(self, events):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for event in events:
+                        data = f"event: data\ndata: {json.dumps(event)}\n\n".encode()
+                        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def watch(self, ws_id):
+                # Send the workspace whenever it changes, like /workspaces/{id}/watch
+                last = None
+                deadline = time.monotonic() + 30
+                while time.monotonic() < deadline:
+                    current = mock.snapshot(ws_id)
+                    if current != last:
+                        last = current
+                        yield current
+                    time.sleep(0.01)
+
+            def do_POST(self):
+                path = urlparse(self.path).path.replace("/api/v2", "")
+                mock.calls.append(("POST", path))
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                match = re.fullmatch(r"/workspaces/([\w-]+)/builds", path)
+                if match and match.group(1) in mock.workspaces:
+                    return self.send_json(mock.create_build(match.group(1), body["transition"]), 201)
+                self.send_json({"message": "not found"}, 404)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                path, query = url.path.replace("/api/v2", ""), parse_qs(url.query)
+                mock.calls.append(("GET", path))
+                mock.queries.append((path, query))
+                if mock.latency:
+                    time.sleep(mock.latency)
+                status = mock.fail(path, query) if mock.fail else None
+                if status:
+                    return self.send_json({"message": "injected failure"}, status)
+                limit = int(query.get("limit", ["0"])[0])
+                offset = int(query.get("offset", ["0"])[0])
+                if path == "/audit":
+                    with mock.lock:
+                        items = sorted(mock.audit_logs, key=lambda log: log["time"], reverse=True)
+                    self.send_json({"audit_logs": items[offset:offset + limit], "count": len(items)})
+                    if mock.after_audit_page:
+                        mock.after_audit_page()
+                    return
+                if path == "/workspaces":
+                    with mock.lock:
+                        items = copy.deepcopy(list(mock.workspaces.values()))
+                    page = items[offset:offset + limit] if limit else items[offset:]
+                    return self.send_json({"workspaces": page, "count": len(items)})
+                if path == "/insights/templates":
+                    return self.send_json({"report": {"active_users": 2, "template_ids": [], "apps_usage": []}})
+                if path == "/insights/user-activity":
+                    return self.send_json({"report": {"users": [{"username": "user0", "seconds": 600}]}})
+                match = re.fullmatch(r"/organizations/([\w-]+)/templates", path)
+                if match:
+                    return self.send_json(mock.org_templates.get(match.group(1), []))
+                if path == "/users/me":
+                    return self.send_json({**mock.users[0], "organization_ids": [org["id"] for org in mock.organizations]})
+                if path == "/updatecheck":
+                    return self.send_json({"current": True, "version": "v2.15.0"})
+                if path == "/users/me/organizations":
+                    return self.send_json(mock.organizations)
+                if path == "/organizations/org1/provisionerdaemons":
+                    return self.send_json([{"id": "d1", "tags": {"scope": "organization"}}])
+                if path == "/organizations/org1/provisionerjobs":
+                    with mock.lock:
+                        jobs = list(mock.provisioner_jobs.values())
+                    if "status" in query:
+                        jobs = [job for job in jobs if job["status"] in query["status"][0].split(",")]
+                    if "ids" in query:
+                        jobs = [job for job in jobs if job["id"] in query["ids"][0].split(",")]
+                    return self.send_json(jobs[:limit or 50])
+                match = re.fullmatch(r"/templates/([\w-]+)(/versions)?", path)
+                if match and match.group(1) in mock.templates:
+                    if match.group(2):
+                        return self.send_json([version for version in mock.template_versions
+                                               if version["template_id"] == match.group(1)])
+                    return self.send_json(mock.templates[match.group(1)])
+                if path == "/users":
+                    page = mock.users[offset:offset + limit] if limit else mock.users[offset:]
+                    return self.send_json({"users": page, "count": len(mock.users)})
+                if path == "/debug/health":
+                    return self.send_json({"healthy": True})
+                match = re.fullmatch(r"/workspaces/([\w-]+)(/watch|/port-share)?", path)
+                if match and match.group(1) in mock.workspaces:
+                    if match.group(2) == "/watch":
+                        return self.send_events(self.watch(match.group(1)))
+                    if match.group(2) == "/port-share":
+                        return self.send_json({"shares": []})
+                    return self.send_json(mock.snapshot(match.group(1)))
+                if re.fullmatch(r"/templateversions/[\w-]+/resources", path):
+                    return self.send_json([{"name": "main", "agents": []}])
+                if re.fullmatch(r"/workspaceagents/[\w-]+/watch-metadata", path):
+                    return self.send_events([[{"description": {"display_name": "CPU"}, "result": {"value": "5%"}}]])
+                self.send_json({"message": f"not found {path}"}, 404)
+
+        return Handler
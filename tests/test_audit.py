@@ -0,0 +1,40 @@
+def add_logs(mock_coder, first, count):
+    for i in range(first, first + count):
+        mock_coder.add_audit_log(f"al{i}", f"2024-05-01T10:{i // 60:02d}:{i % 60:02d}Z")
+
+
+def test_pages_back_to_the_cursor_oldest_first(cli, mock_coder):
+    add_logs(mock_coder, 0, 60)
+    cursor = {"time": "2024-05-01T10:00:09Z", "ids": ["al9"]}
+
+    logs = cli.fetch_new_audit_logs(cursor, page_size=20)
+
+    assert [log["id"] for log in logs] == [f"al{i}" for i in range(10, 60)]
+
+
+def test_failed_page_returns_none_so_the_cursor_stays(cli, mock_coder):
+    add_logs(mock_coder, 0, 60)
+    cursor = {"time": "2024-05-01T10:00:09Z", "ids": ["al9"]}
+    mock_coder.fail = lambda path, query: 500 if path == "/audit" and query.get("offset") == ["20"] else None
+
+    assert cli.fetch_new_audit_logs(cursor, page_size=20) is None
+
+
+def test_entries_shifted_by_new_arrivals_are_not_repeated(cli, mock_coder):
+    add_logs(mock_coder, 0, 60)
+    cursor = {"time": "2024-05-01T10:00:09Z", "ids": ["al9"]}
+    arrivals = iter([5, 5, 0, 0])
+    added = [60]
+
+    def new_arrivals():
+        count = next(arrivals, 0)
+        add_logs(mock_coder, added[0], count)
+        added[0] += count
+
+    mock_coder.after_audit_page = new_arrivals
+
+    logs = cli.fetch_new_audit_logs(cursor, page_size=20)
+
+    ids = [log["id"] for log in logs]
+    assert len(ids) == len(set(ids))
+    assert set(ids) >= {f"al{i}" for i in range(10, 60)}
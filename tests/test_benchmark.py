@@ -0,0 +1,51 @@
+import threading
+import time
+
+
+def test_cycle_records_every_phase_in_order(cli, mock_coder):
+    workspace = mock_coder.add_workspace("w1")
+
+    results = cli.benchmark_workspace(workspace, 2)
+
+    assert [result["cycle"] for result in results] == [1, 2]
+    for result in results:
+        assert result["error"] == ""
+        assert 0 <= result["queued"] <= result["running"] <= result["agent_connected"] <= result["first_metadata"]
+        assert result["stopped"] > 0
+    assert mock_coder.builds == [("w1", "start"), ("w1", "stop")] * 2
+    assert mock_coder.snapshot("w1")["latest_build"]["status"] == "stopped"
+
+
+def test_running_workspace_is_stopped_first(cli, mock_coder):
+    workspace = mock_coder.add_workspace("w1", "running")
+
+    results = cli.benchmark_workspace(workspace, 1)
+
+    assert results[0]["error"] == ""
+    assert mock_coder.builds == [("w1", "stop"), ("w1", "start"), ("w1", "stop")]
+
+
+def test_starting_workspace_is_waited_on_then_stopped(cli, mock_coder):
+    workspace = mock_coder.add_workspace("w1", "starting")
+    threading.Timer(0.3, mock_coder.set_build, args=("w1",),
+                    kwargs={"status": "running", "resources": mock_coder.agents("w1", "connected")}).start()
+
+    results = cli.benchmark_workspace(workspace, 1)
+
+    assert results[0]["error"] == ""
+    # No stop can be sent until the start in progress has finished
+    assert mock_coder.builds[0] == ("w1", "stop")
+    assert len(mock_coder.builds) == 3
+
+
+def test_failed_workspace_reports_an_error_without_cycling(cli, mock_coder):
+    workspace = mock_coder.add_workspace("w1", "failed")
+
+    started = time.monotonic()
+    results = cli.benchmark_workspace(workspace, 3)
+
+    assert time.monotonic() - started < 5
+    assert len(results) == 1
+    assert results[0]["cycle"] == 0
+    assert "could not stop workspace" in results[0]["error"]
+    assert mock_coder.builds == []
@@ -0,0 +1,15 @@
+def test_cached_template_is_refetched_when_workspaces_report_a_new_active_version(cli, mock_coder):
+    template, versions = cli.resolve_template_versions("t1", "v1")
+    assert template["active_version_id"] == "v1"
+
+    mock_coder.template_versions.insert(0, {"id": "v2", "name": "v2", "template_id": "t1", "created_at": "2024-05-02T10:00:00Z"})
+    mock_coder.templates["t1"] = {**mock_coder.templates["t1"], "active_version_id": "v2"}
+    mock_coder.calls.clear()
+
+    # Same active version as cached, so nothing is fetched
+    cli.resolve_template_versions("t1", "v1")
+    assert mock_coder.calls == []
+
+    template, versions = cli.resolve_template_versions("t1", "v2")
+    assert template["active_version_id"] == "v2"
+    assert [version["id"] for version in versions] == ["v2", "v1"]
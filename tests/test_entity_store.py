@@ -0,0 +1,33 @@
+def test_older_copy_never_replaces_newer(cli):
+    store = cli.EntityStore(10)
+    store.put("workspace", {"id": "w1", "updated_at": "2024-01-02T00:00:00Z", "name": "new"})
+    kept = store.put("workspace", {"id": "w1", "updated_at": "2024-01-01T00:00:00Z", "name": "old"})
+
+    assert kept["name"] == "new"
+    assert store.get("workspace", "w1")["name"] == "new"
+
+
+def test_objects_past_max_age_count_as_stale(cli, monkeypatch):
+    store = cli.EntityStore(10)
+    now = [100.0]
+    monkeypatch.setattr(cli.time, "monotonic", lambda: now[0])
+    store.put("workspace", {"id": "w1"})
+
+    now[0] += 10
+    assert store.get("workspace", "w1", max_age=30) is not None
+    now[0] += 30
+    assert store.get("workspace", "w1", max_age=30) is None
+    assert store.get("workspace", "w1") is not None
+    assert (store.hits, store.misses, store.stale) == (2, 0, 1)
+
+
+def test_least_recently_used_objects_are_evicted(cli):
+    store = cli.EntityStore(2)
+    store.put("user", {"id": "u1"})
+    store.put("user", {"id": "u2"})
+    store.get("user", "u1")
+    store.put("user", {"id": "u3"})
+
+    assert store.get("user", "u2") is None
+    assert store.get("user", "u1") is not None
+    assert store.evictions == 1
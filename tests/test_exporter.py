@@ -0,0 +1,66 @@
+import threading
+import time
+
+import requests
+
+
+def deployment(mock_coder):
+    return {"coder_url": mock_coder.url, "coder_session_token": "test-token"}
+
+
+def samples_by_name(samples):
+    return {name: value for name, labels, value in samples if len(labels) == 1}
+
+
+def test_scrape_never_exceeds_its_budget(cli, mock_coder):
+    for i in range(3):
+        mock_coder.add_workspace(f"w{i}")
+
+    samples = samples_by_name(cli.scrape_deployment(deployment(mock_coder), 3))
+
+    assert len(mock_coder.calls) == 3
+    assert samples["coder_scrape_requests"] == 3
+    assert samples["coder_scrape_partial"] == 1
+    assert samples["coder_up"] == 1
+
+
+def test_scrape_within_budget_is_complete(cli, mock_coder):
+    mock_coder.add_workspace("w1", "running")
+
+    samples = cli.scrape_deployment(deployment(mock_coder), 50)
+
+    assert samples_by_name(samples)["coder_scrape_partial"] == 0
+    assert ("coder_workspaces", {"deployment": mock_coder.url, "status": "running", "template": ""}, 1) in samples
+
+
+def test_metrics_requests_make_no_upstream_calls(cli, mock_coder, monkeypatch):
+    monkeypatch.setattr(cli, "deployments", [deployment(mock_coder)])
+    server = cli.create_exporter("127.0.0.1", 0, 3600, 50)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    metrics_url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+    try:
+        # The first scrape runs in the background, wait for it to land
+        started = time.monotonic()
+        while "coder_scrape_requests" not in requests.get(metrics_url).text:
+            assert time.monotonic() - started < 10
+            time.sleep(0.05)
+        upstream_calls = len(mock_coder.calls)
+
+        for _ in range(5):
+            assert requests.get(metrics_url).status_code == 200
+
+        assert len(mock_coder.calls) == upstream_calls
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_exporter_listens_on_loopback_by_default(cli, monkeypatch):
+    monkeypatch.setattr(cli, "deployments", [])
+    monkeypatch.setattr("sys.argv", ["coder-cli.py", "--exporter"])
+    hosts = []
+    monkeypatch.setattr(cli, "run_exporter", lambda host, port, interval, budget: hosts.append(host))
+
+    cli.main()
+
+    assert hosts == ["127.0.0.1"]
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta, timezone
+
+
+def ago(**delta):
+    return (datetime.now(timezone.utc) - timedelta(**delta)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def add_running(mock_coder, ws_id, last_used_at, built_at, agent_status="connected"):
+    workspace = mock_coder.add_workspace(ws_id, "running")
+    workspace["last_used_at"] = last_used_at
+    workspace["latest_build"]["created_at"] = built_at
+    workspace["latest_build"]["resources"] = mock_coder.agents(ws_id, agent_status)
+
+
+def scan(cli, monkeypatch, capsys):
+    answers = iter(["24", "14"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+    cli.scan_idle_workspaces()
+    return {line.split()[1].split("/")[1]: line for line in capsys.readouterr().out.splitlines() if "user0/" in line}
+
+
+def test_parse_timestamps_drops_digits_past_microseconds(cli):
+    parsed = cli.parse_timestamps(["2024-05-01T10:00:00.1234567Z", "2024-05-01T10:00:00Z", None])
+
+    assert parsed["2024-05-01T10:00:00.1234567Z"] == datetime(2024, 5, 1, 10, 0, 0, 123456, tzinfo=timezone.utc)
+    assert parsed["2024-05-01T10:00:00Z"] == datetime(2024, 5, 1, 10, tzinfo=timezone.utc)
+    assert None not in parsed
+
+
+def test_workspaces_in_use_are_never_listed_however_old_their_build(cli, mock_coder, monkeypatch, capsys):
+    add_running(mock_coder, "used", ago(minutes=5), ago(days=900))
+    add_running(mock_coder, "unused", ago(hours=48), ago(days=900))
+    add_running(mock_coder, "idle", ago(hours=48), ago(days=1))
+    add_running(mock_coder, "disconnected", ago(minutes=5), ago(days=1), "disconnected")
+
+    listed = scan(cli, monkeypatch, capsys)
+
+    assert set(listed) == {"ws-unused", "ws-idle", "ws-disconnected"}
+    assert "stale: built 900d ago, unused 48h" in listed["ws-unused"]
+    assert "idle: unused 48h" in listed["ws-idle"]
+    assert "stale: no agent connected" in listed["ws-disconnected"]
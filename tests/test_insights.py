@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone
+
+
+def requested_days(mock_coder):
+    return sorted(query["start_time"][0][:10] for path, query in mock_coder.queries if path == "/insights/templates")
+
+
+def test_second_run_only_requests_days_that_have_not_settled(cli, mock_coder, monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, "state_dir", str(tmp_path))
+
+    cli.show_insights()
+    assert len(requested_days(mock_coder)) == max(cli.insights_windows)
+
+    mock_coder.queries.clear()
+    cli.show_insights()
+
+    now = datetime.now(timezone.utc)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    # Today is always open, and yesterday too until the settle time after midnight has passed
+    open_days = [day.strftime("%Y-%m-%d") for day in (today - timedelta(days=1), today)
+                 if day + timedelta(days=1) + cli.insights_settle_time >= now]
+    assert requested_days(mock_coder) == open_days
+
+
+def test_days_inside_the_settle_time_are_not_cached(cli, mock_coder, monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, "state_dir", str(tmp_path))
+    # Just after midnight UTC yesterday's bucket may still be missing late agent stats
+    monkeypatch.setattr(cli, "insights_settle_time", timedelta(days=2))
+
+    cli.show_insights()
+
+    cached = cli.load_state("insights", {})["days"]
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).strftime("%Y-%m-%d")
+    assert today not in cached and yesterday not in cached
+    assert len(cached) == max(cli.insights_windows) - 3
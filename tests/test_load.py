@@ -0,0 +1,56 @@
+import time
+
+
+def add_workspaces(mock_coder):
+    for i in range(3):
+        mock_coder.add_workspace(f"w{i}", "running")
+
+
+def test_concurrency_mode_calls_every_endpoint(cli, mock_coder):
+    add_workspaces(mock_coder)
+
+    results = cli.run_load_test(cli.default_load_mix, 0, 4, 1)
+
+    assert set(results) == set(cli.load_endpoints)
+    for result in results.values():
+        assert result["latencies"]
+        assert result["errors"] == 0
+        assert result["dropped"] == 0
+
+
+def test_rate_mode_drops_calls_beyond_concurrency(cli, mock_coder):
+    add_workspaces(mock_coder)
+    mock_coder.latency = 0.3
+
+    started = time.monotonic()
+    results = cli.run_load_test("users=1", 40, 2, 1)
+    elapsed = time.monotonic() - started
+
+    # The first workspaces page is fetched before the clock starts, and calls still
+    # in flight at the deadline are abandoned rather than waited for
+    assert elapsed < 0.3 + 1 + 0.5
+    users = results["users"]
+    assert users["dropped"] > 20
+    assert len(users["latencies"]) <= 2 * (1 / 0.3)
+    # Each latency counts from when the call was due, so it includes the server delay
+    assert min(users["latencies"]) >= 0.3
+    assert users["errors"] == 0
+
+
+def test_rate_mode_ignores_calls_finishing_after_the_deadline(cli, mock_coder):
+    add_workspaces(mock_coder)
+    mock_coder.latency = 2
+
+    results = cli.run_load_test("health=1", 5, 10, 1)
+
+    assert results["health"]["latencies"] == []
+    assert results["health"]["dropped"] == 0
+
+
+def test_bad_weights_are_reported_without_calling(cli, mock_coder, capsys):
+    add_workspaces(mock_coder)
+
+    for mix in ("users=x", "users=-1", "users=nan", "users=0,health=0"):
+        assert cli.run_load_test(mix, 0, 2, 1) is None
+        assert "weight" in capsys.readouterr().out
+    assert ("GET", "/users") not in mock_coder.calls
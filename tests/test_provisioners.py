@@ -0,0 +1,71 @@
+import threading
+import time
+
+
+def test_sample_lists_every_active_job(cli, mock_coder):
+    for i in range(250):
+        mock_coder.add_provisioner_job(f"j{i}", "pending" if i % 2 else "running")
+    mock_coder.add_provisioner_job("done", "succeeded")
+
+    _, active, finished, _ = cli.sample_provisioners(["org1"], False)
+
+    assert len(active) == 250
+    assert finished == {}
+
+
+def test_jobs_gone_since_the_last_sample_are_fetched_by_id(cli, mock_coder):
+    mock_coder.add_provisioner_job("fast")
+    mock_coder.add_provisioner_job("slow", "running", started_at="2024-05-01T10:00:05Z")
+    _, previous, _, _ = cli.sample_provisioners(["org1"], False)
+
+    # The pending job ran and finished between samples, so it was never seen running
+    mock_coder.provisioner_jobs["fast"].update(status="succeeded", started_at="2024-05-01T10:00:02Z",
+                                               completed_at="2024-05-01T10:00:04Z")
+    _, active, finished, _ = cli.sample_provisioners(["org1"], False, previous)
+
+    assert set(active) == {"slow"}
+    assert finished["fast"]["started_at"] == "2024-05-01T10:00:02Z"
+    assert finished["fast"]["completed_at"] == "2024-05-01T10:00:04Z"
+
+
+def test_finished_jobs_are_looked_up_in_one_call(cli, mock_coder):
+    for i in range(100):
+        mock_coder.add_provisioner_job(f"j{i}")
+    _, previous, _, _ = cli.sample_provisioners(["org1"], False)
+    for job in mock_coder.provisioner_jobs.values():
+        job.update(status="succeeded", started_at="2024-05-01T10:00:02Z", completed_at="2024-05-01T10:00:04Z")
+    mock_coder.calls.clear()
+
+    _, active, finished, _ = cli.sample_provisioners(["org1"], False, previous)
+
+    assert active == {}
+    assert len(finished) == 100
+    # One call for the active jobs and one for the finished ones
+    assert mock_coder.calls == [("GET", "/organizations/org1/provisionerjobs")] * 2
+
+
+def test_monitor_keeps_sampling_after_a_failed_sample(cli, mock_coder, monkeypatch, capsys):
+    mock_coder.add_provisioner_job("j1")
+    failures = iter([502])
+    mock_coder.fail = lambda path, query: next(failures, None) if path.endswith("/provisionerjobs") else None
+    answers = iter(["1", "15", "60"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+    sleeps = []
+    real_sleep = time.sleep
+
+    def sleep(seconds):
+        # Threads left over from other tests (e.g. mock builds) keep sleeping for real
+        if threading.current_thread() is not threading.main_thread():
+            return real_sleep(seconds)
+        sleeps.append(seconds)
+        if len(sleeps) >= 3:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(cli.time, "sleep", sleep)
+
+    cli.monitor_provisioners()
+
+    out = capsys.readouterr().out
+    assert "Error sampling provisioners" in out
+    assert "Stopped monitoring provisioners" in out
+    assert out.count("Provisioner queue on") == 2
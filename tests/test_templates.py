@@ -0,0 +1,18 @@
+def template(template_id, org_id):
+    return {"id": template_id, "name": "docker", "display_name": "Docker", "organization_id": org_id,
+            "created_at": "2024-05-01T10:00:00Z", "updated_at": "2024-05-01T10:00:00Z",
+            "created_by_name": "admin", "active_user_count": 1}
+
+
+def test_template_urls_name_the_organization(cli, mock_coder, monkeypatch, capsys):
+    monkeypatch.setattr(cli, "current_deployment", {"coder_url": mock_coder.url})
+    mock_coder.organizations.append({"id": "org2", "name": "eng", "display_name": "Engineering"})
+    mock_coder.org_templates = {"org1": [template("t1", "org1")], "org2": [template("t2", "org2")]}
+
+    cli.print_templates(cli.get_templates())
+
+    out = capsys.readouterr().out
+    # Both organizations have a template called docker, each URL must open its own
+    assert f"URL: {mock_coder.url}/templates/default/docker" in out
+    assert f"URL: {mock_coder.url}/templates/eng/docker" in out
+    assert "Organization: Engineering" in out